@@ -1,11 +1,33 @@
-from flask import Flask, jsonify, request, send_file, render_template, send_from_directory
+from flask import Flask, Response, jsonify, request, send_file, render_template, send_from_directory, stream_with_context
+import collections
+import csv
+import io
 import threading
+import json
+import multiprocessing
 import uuid
 import os
 import time
 import sys
 import webbrowser
-from star_scraper import StarPlanScraper
+from star_scraper import COLUMNS, StarPlanScraper
+from rate_limit import AdaptiveRateLimiter, RateLimiter
+from transport import make_transport
+from http_cache import HttpCache
+from incremental import DepartmentStore
+from sinks import MultiSink, PreviewSink, open_sink
+from checkpoint import CheckpointStore
+from job_store import SqliteJobStore
+from crawl_coordinator import SingleFlight
+from job_scheduler import JobScheduler, QueueFull
+from university_cache import UniversityIndex
+from metrics import MetricsRegistry
+from result_index import INDEXED_COLUMNS, ResultIndexCache
+from eligibility import EligibilityMatcher
+from snapshot_store import SnapshotStore
+from page_archive import PageArchive
+from work_queue import WorkQueue
+from shard_worker import ShardWorker
 
 # Handle PyInstaller static path
 if getattr(sys, 'frozen', False):
@@ -20,93 +42,386 @@ else:
 def index():
     return send_from_directory(app.static_folder, 'index.html')
 
-# Global state to store scraper status
-# key: job_id, value: dict
-jobs = {}
+def env_number(name, default=None, cast=float):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+# Crawl concurrency / politeness settings
+# STAR_MAX_WORKERS: concurrent page fetches per job (1 = serial crawl)
+# STAR_GLOBAL_RPS / STAR_PER_HOST_RPS: request-per-second limits
+SCRAPER_OPTIONS = {
+    'max_workers': env_number('STAR_MAX_WORKERS', 1, int),
+    'requests_per_second': env_number('STAR_GLOBAL_RPS'),
+    'per_host_rps': env_number('STAR_PER_HOST_RPS'),
+    # STAR_PARSER_BACKEND: html.parser / lxml / selectolax / auto (fastest installed)
+    'parser_backend': os.environ.get('STAR_PARSER_BACKEND', 'auto'),
+    # STAR_PARSE_WORKERS: parse department pages in this many processes (0 = inline)
+    'parse_workers': env_number('STAR_PARSE_WORKERS', 0, int),
+    # STAR_OFFLINE=1 replays crawls from the response cache only
+    'offline': os.environ.get('STAR_OFFLINE') == '1',
+}
+
+# Jobs crawling the same pages at the same time share each in-flight fetch
+fetch_coordinator = SingleFlight()
+SCRAPER_OPTIONS['fetch_coordinator'] = fetch_coordinator
+
+# Pooled HTTP client shared by every job so connections stay warm between crawls
+# STAR_HTTP_CLIENT: requests (default) or httpx; STAR_HTTP2=1 uses httpx over HTTP/2
+# STAR_POOL_SIZE: max open connections per host (default max(10, STAR_MAX_WORKERS * concurrent jobs))
+SCRAPER_OPTIONS['transport'] = make_transport(
+    os.environ.get('STAR_HTTP_CLIENT', 'requests'),
+    pool_size=env_number('STAR_POOL_SIZE', max(10, SCRAPER_OPTIONS['max_workers'] * env_number('STAR_MAX_CONCURRENT_JOBS', 2, int)), int),
+    http2=os.environ.get('STAR_HTTP2') == '1',
+)
+
+# One limiter for every job so they share what they learn about each host.
+# STAR_ADAPTIVE_RATE=0 keeps fixed limits; otherwise the per-host rate starts at
+# STAR_INITIAL_RPS and adapts up to STAR_PER_HOST_RPS (default 8) from server feedback
+if os.environ.get('STAR_ADAPTIVE_RATE', '1') != '0':
+    SCRAPER_OPTIONS['rate_limiter'] = AdaptiveRateLimiter(
+        SCRAPER_OPTIONS['requests_per_second'],
+        initial_rps=env_number('STAR_INITIAL_RPS', 1.0),
+        max_rps=SCRAPER_OPTIONS['per_host_rps'] or 8.0,
+    )
+elif SCRAPER_OPTIONS['requests_per_second'] or SCRAPER_OPTIONS['per_host_rps']:
+    SCRAPER_OPTIONS['rate_limiter'] = RateLimiter(SCRAPER_OPTIONS['requests_per_second'], SCRAPER_OPTIONS['per_host_rps'])
+else:
+    SCRAPER_OPTIONS['adaptive_rate'] = False
+
+# STAR_OUTPUT_FORMAT: xlsx (default), csv, jsonl, parquet or arrow; rows are streamed to the file as they are parsed
+OUTPUT_FORMAT = os.environ.get('STAR_OUTPUT_FORMAT', 'xlsx')
+STALE_JOB_SECONDS = 120
+
+# On-disk stores, opened by open_stores() at startup
+checkpoints = None
+jobs = None
+work_queue = None
+snapshots = None
+
+def open_stores():
+    """
+    Open the caches, archive and sqlite stores. Not done on import: the reloader's file
+    watcher and the parse pool's spawned children import this module too, and must not
+    hold files (or the page archive's writer lock) the serving process needs.
+    """
+    global checkpoints, jobs, work_queue, snapshots
+
+    # Response cache shared by all jobs (enabled when STAR_CACHE_DIR is set)
+    # STAR_CACHE_TTL: seconds before a cached page is revalidated (default 1 hour)
+    # STAR_CACHE_MAX_AGE: seconds before an entry is evicted entirely
+    # STAR_CACHE_MAX_MB: total size limit of cached bodies
+    if os.environ.get('STAR_CACHE_DIR'):
+        max_mb = env_number('STAR_CACHE_MAX_MB')
+        SCRAPER_OPTIONS['cache'] = HttpCache(
+            os.environ['STAR_CACHE_DIR'],
+            ttl=env_number('STAR_CACHE_TTL', 3600),
+            max_age=env_number('STAR_CACHE_MAX_AGE'),
+            max_bytes=int(max_mb * 1024 * 1024) if max_mb else None,
+        )
+
+    # Every fetched page is archived for /api/reextract (enabled when STAR_ARCHIVE_DIR is set).
+    # One web worker process writes it; the others only read it
+    if os.environ.get('STAR_ARCHIVE_DIR'):
+        SCRAPER_OPTIONS['archive'] = PageArchive(os.environ['STAR_ARCHIVE_DIR'])
+
+    # Incremental crawling: remember page hashes + parsed rows (enabled when STAR_STATE_DB is set)
+    if os.environ.get('STAR_STATE_DB'):
+        SCRAPER_OPTIONS['department_store'] = DepartmentStore(os.environ['STAR_STATE_DB'])
+
+    # Crawl checkpoints for /api/resume (STAR_CHECKPOINT_DB, default star_checkpoints.sqlite in the working dir)
+    checkpoints = CheckpointStore(os.environ.get('STAR_CHECKPOINT_DB', os.path.join(os.getcwd(), 'star_checkpoints.sqlite')))
+
+    # Job state lives in sqlite so every gunicorn worker sees every job, and finished jobs survive restarts
+    # (STAR_JOB_DB, default star_jobs.sqlite in the working dir)
+    jobs = SqliteJobStore(os.environ.get('STAR_JOB_DB', os.path.join(os.getcwd(), 'star_jobs.sqlite')))
+
+    # Sharded crawls (/api/start with "sharded": true) go through a work queue shared with
+    # backend/shard_worker.py processes on other machines (STAR_WORK_QUEUE_DB, e.g. on a shared disk).
+    work_queue = WorkQueue(os.environ['STAR_WORK_QUEUE_DB']) if os.environ.get('STAR_WORK_QUEUE_DB') else None
 
-class ScraperThread(threading.Thread):
-    def __init__(self, job_id, url, targets=None):
-        super().__init__()
+    # Year-over-year snapshots of full crawls for /api/snapshots (enabled when STAR_SNAPSHOT_DIR is set, needs pyarrow)
+    snapshots = SnapshotStore(os.environ['STAR_SNAPSHOT_DIR']) if os.environ.get('STAR_SNAPSHOT_DIR') else None
+
+class JobPreviewSink(PreviewSink):
+    """Preview rows are published to the job state as they arrive, so /api/stream can push them."""
+
+    def __init__(self, job_id, limit=10):
+        super().__init__(limit)
+        self.job_id = job_id
+
+    def write(self, row):
+        if len(self.rows) < self.limit:
+            super().write(row)
+            jobs.update(self.job_id, {'preview_data': self.rows})
+
+
+FINISHED_STATUSES = ('completed', 'error', 'cancelled')
+
+# Fetch / throttle / parse timings of this process, served by /api/metrics
+metrics = MetricsRegistry()
+
+# Indexed rows of recently queried jobs for /api/query
+# STAR_QUERY_CACHE_JOBS: jobs kept indexed per web worker (default 8)
+result_indexes = ResultIndexCache(env_number('STAR_QUERY_CACHE_JOBS', 8, int))
+
+# STAR_ELIGIBILITY_MAX_STUDENTS: student profiles accepted per /api/eligibility request
+ELIGIBILITY_MAX_STUDENTS = env_number('STAR_ELIGIBILITY_MAX_STUDENTS', 10000, int)
+ELIGIBILITY_COLUMNS = ['學校名稱', '學系名稱', '校系代碼', '學群類別', '資料連結']
+
+
+class ScrapeJob:
+    """One crawl job. Queued on the scheduler (see submit_job); run() executes on one of its worker threads."""
+
+    def __init__(self, job_id, url, targets=None, resume=False, retry_universities=None, reextract=False,
+                 sharded=False):
         self.job_id = job_id
         self.url = url
         self.targets = targets
+        self.resume = resume
+        self.retry_universities = retry_universities
+        self.reextract = reextract
+        self.sharded = sharded
         self.scraper = None
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+        if self.scraper:
+            self.scraper.should_stop = True
 
     def run(self):
-        jobs[self.job_id] = {
-            'status': 'starting',
-            'progress': 0,
-            'message': '初始化中...',
-            'current': 0,
-            'total': 0,
-            'filename': None,
-            'error': None
-        }
-        
-        def progress_callback(current, total, message, phase="scanning"):
-            # Update job status
-            progress = 0
-            if phase == "scanning":
-                # Phase 1: Scanning universities (roughly 10% of work)
-                progress = int((current / max(total, 1)) * 10)
-            elif phase == "details":
-                # Phase 2: Details (90% of work)
-                progress = 10 + int((current / max(total, 1)) * 90)
-            elif phase == "done":
+        state = jobs.get(self.job_id)
+        if self.cancelled or (state and state.get('cancel_requested')):
+            jobs.update(self.job_id, {'status': 'cancelled', 'message': '已取消', 'queue_position': None})
+            return
+        jobs.update(self.job_id, {'status': 'starting', 'message': '初始化中...', 'queue_position': None})
+        job_metrics = metrics.job(self.job_id)
+        recent_log = collections.deque(maxlen=20)
+
+        def log_callback(message):
+            recent_log.append(message)
+            jobs.update(self.job_id, {'log': list(recent_log)})
+
+        def progress_callback(current, total, message, phase="details"):
+            # Universities are scanned while departments are fetched: count both kinds of page,
+            # expecting unscanned universities to have as many departments as the scanned ones
+            scanned, universities = self.scraper.scan_progress if self.scraper else (0, 0)
+            expected = total * universities / scanned if 0 < scanned < universities else total
+            progress = min(99, int((scanned + current) / max(universities + expected, 1) * 100))
+            if phase == "done":
                 progress = 100
-                
-            jobs[self.job_id].update({
+
+            state = jobs.update(self.job_id, {
                 'status': 'running',
                 'progress': progress,
                 'message': message,
                 'current': current,
-                'total': total
+                'total': total,
+                'scanned_universities': scanned,
+                'total_universities': universities,
+                'failed_count': len(self.scraper.failures) if self.scraper else 0
             })
+            # Cancel requests sent to another worker arrive through the job store
+            if state and state.get('cancel_requested'):
+                self.cancel()
 
         try:
-            self.scraper = StarPlanScraper(self.url, progress_callback)
-            self.scraper.run(target_universities=self.targets)
-            
-            # Save file
-            filename = f"star_plan_analysis_{self.job_id}.xlsx"
+            checkpoints.save_params(self.job_id, {'url': self.url, 'targets': self.targets, 'reextract': self.reextract,
+                                                  'sharded': self.sharded})
+            options = dict(SCRAPER_OPTIONS)
+            if self.reextract:
+                # Replay every page from the archive and parse it again on all cores. Without the
+                # department store every page is parsed, even if its hash is unchanged. Its misses
+                # must not be shared with live crawls fetching the same URLs, so no fetch coordinator
+                cores = os.cpu_count() or 1
+                options.update(offline=True, parse_workers=cores, max_workers=cores, department_store=None,
+                               fetch_coordinator=None)
+            checkpoint = checkpoints.job(self.job_id)
+
+            # Stream rows straight into the output file; only the preview stays in memory
+            filename = f"star_plan_analysis_{self.job_id}.{OUTPUT_FORMAT}"
             filepath = os.path.join(os.getcwd(), filename)
-            self.scraper.save_to_excel(filepath)
-            
-            # Save preview data (first 10 rows)
-            preview_data = self.scraper.results[:10] if self.scraper.results else []
-            
-            jobs[self.job_id].update({
+            preview = JobPreviewSink(self.job_id, 10)
+            with MultiSink(open_sink(filepath, COLUMNS), preview) as sink:
+                self.scraper = StarPlanScraper(self.url, progress_callback, sink=sink, keep_results=False,
+                                               checkpoint=checkpoint, metrics=job_metrics,
+                                               log_callback=log_callback, **options)
+                self.scraper.should_stop = self.cancelled
+                if self.sharded:
+                    # Shard workers fetch; this job queues the work and merges their rows
+                    self.scraper.run_sharded(work_queue, self.job_id, self.targets, resume=self.resume)
+                else:
+                    self.scraper.run(target_universities=self.targets, resume=self.resume,
+                                     retry_universities=self.retry_universities)
+
+            if self.cancelled:
+                # Keep the checkpoint so the job can still be resumed
+                jobs.update(self.job_id, {
+                    'status': 'cancelled',
+                    'message': '已取消',
+                    'filename': filename,
+                    'row_count': self.scraper.row_count,
+                    'failures': self.scraper.failures,
+                    'failed_count': len(self.scraper.failures),
+                    'metrics': job_metrics.summary()
+                })
+                return
+
+            if not self.scraper.failures:
+                # Output is complete, the checkpoint is no longer needed
+                checkpoints.discard(self.job_id)
+            # else: keep it, /api/retry refetches only the failed URLs and rewrites the output
+
+            jobs.update(self.job_id, {
                 'status': 'completed',
                 'progress': 100,
                 'message': '分析完成！',
                 'filename': filename,
-                'preview_data': preview_data
+                'row_count': self.scraper.row_count,
+                'preview_data': preview.rows,
+                'change_stats': self.scraper.change_stats,
+                'failures': self.scraper.failures,
+                'failed_count': len(self.scraper.failures),
+                'metrics': job_metrics.summary()
             })
+            # Index the rows now so the first /api/query doesn't pay for reading the file
+            try:
+                index = result_indexes.get(filepath)
+            except Exception as e:
+                log_callback(f"Could not index results: {e}")
+                return
+            # Only a complete national crawl is a snapshot; partial ones would show false removals.
+            # Re-extracted pages were crawled earlier, so they don't describe today either
+            if snapshots and not self.targets and not self.scraper.failures and not self.reextract:
+                try:
+                    snapshots.save(time.strftime('%Y-%m-%d'), index.rows)
+                except Exception as e:
+                    log_callback(f"Could not save snapshot: {e}")
             
         except Exception as e:
-            jobs[self.job_id].update({
+            jobs.update(self.job_id, {
                 'status': 'error',
                 'message': f'發生錯誤: {str(e)}',
-                'error': str(e)
+                'error': str(e),
+                'failures': self.scraper.failures if self.scraper else [],
+                'metrics': job_metrics.summary()
             })
 
 
+def submit_job(job, priority=0):
+    """
+    Queue a ScrapeJob. Its state is reset to 'queued' first so status / stream requests
+    never miss it. If the queue is full, a resumed / retried job gets its previous state
+    (output file, failures) back and a new one is marked as failed; QueueFull is re-raised.
+    """
+    previous = jobs.get(job.job_id)
+    jobs.create(job.job_id, {
+        'status': 'queued',
+        'progress': 0,
+        'message': '排隊中...',
+        'current': 0,
+        'total': 0,
+        'queue_position': None,
+        'filename': None,
+        'error': None
+    })
+    try:
+        scheduler.submit(job.job_id, job, priority)
+    except QueueFull:
+        if previous:
+            jobs.create(job.job_id, previous)
+        else:
+            jobs.update(job.job_id, {'status': 'error', 'message': '目前排隊人數過多，請稍後再試', 'error': 'queue full'})
+        raise
 
-@app.route('/api/fetch_universities', methods=['POST'])
-def fetch_universities():
-    data = request.json
-    url = data.get('url')
+def publish_queue_positions(positions):
+    for job_id, position in positions.items():
+        jobs.update(job_id, {'queue_position': position, 'message': f'排隊中 (第 {position} 位)'})
+
+# Fixed pool of crawl workers with a bounded waiting line
+# STAR_MAX_CONCURRENT_JOBS: crawls running at once per web worker (default 2)
+# STAR_MAX_QUEUED_JOBS: waiting jobs before /api/start answers 503 (default 50)
+scheduler = JobScheduler(
+    max_concurrent=env_number('STAR_MAX_CONCURRENT_JOBS', 2, int),
+    max_queued=env_number('STAR_MAX_QUEUED_JOBS', 50, int),
+    on_queue_change=publish_queue_positions,
+)
+
+metrics.gauge('jobs_running', "Crawls running in this process", lambda: {(): len(scheduler.running)})
+metrics.gauge('jobs_queued', "Crawls waiting for a worker in this process", lambda: {(): len(scheduler.queue)})
+metrics.gauge('fetches_in_flight', "Distinct URLs being fetched right now", lambda: {(): fetch_coordinator.in_flight()})
+metrics.gauge('fetches_shared_total', "Fetches answered by another job's in-flight request",
+              lambda: {(): fetch_coordinator.shared}, 'counter')
+if hasattr(SCRAPER_OPTIONS.get('rate_limiter'), 'rates'):
+    metrics.gauge('host_rate_rps', "Current adaptive request rate per host",
+                  lambda: {(('host', host),): rate for host, rate in SCRAPER_OPTIONS['rate_limiter'].rates().items()})
+
+
+
+def load_universities(url):
+    # Use scraper just to get list
+    scraper = StarPlanScraper(url, fetch_coordinator=fetch_coordinator, **{
+        key: SCRAPER_OPTIONS[key] for key in ('cache', 'parser_backend', 'rate_limiter', 'transport') if key in SCRAPER_OPTIONS
+    })
+    return scraper.get_universities()
+
+# The list changes about once a year: serve it from memory, refresh in the background once stale
+# STAR_UNIVERSITY_TTL: seconds before a cached list is refreshed (default 6 hours)
+university_index = UniversityIndex(load_universities, ttl=env_number('STAR_UNIVERSITY_TTL', 6 * 3600))
+
+def universities_response(url):
     if not url:
         return jsonify({'error': '請提供網址'}), 400
-        
+
     try:
-        # Use scraper just to get list
-        scraper = StarPlanScraper(url)
-        unis = scraper.get_universities()
-        return jsonify({'universities': unis})
+        unis, etag = university_index.get(url)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+    # Browsers send the ETag back; unchanged lists cost a 304 with no body
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({'universities': unis})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/api/universities')
+def get_universities():
+    return universities_response(request.args.get('url'))
+
+@app.route('/api/fetch_universities', methods=['POST'])
+def fetch_universities():
+    data = request.json
+    return universities_response(data.get('url'))
+
+def start_background_work():
+    """
+    Open the stores, then start the crawl workers, the university list preload and the
+    in-process shard worker. Not done on import: the parse pool's spawned children import
+    this module again (as __mp_main__ under `python app.py` and in the PyInstaller build).
+    """
+    open_stores()
+    scheduler.start()
+    # STAR_PRELOAD_URLS: comma separated base URLs whose lists are loaded at startup
+    for preload_url in filter(None, os.environ.get('STAR_PRELOAD_URLS', '').split(',')):
+        threading.Thread(target=university_index.get, args=(preload_url.strip(),), daemon=True).start()
+    # STAR_SHARD_WORKERS: threads of a shard worker inside this process (default 0 = coordinate only)
+    if work_queue and env_number('STAR_SHARD_WORKERS', 0, int) > 0:
+        ShardWorker(work_queue, threads=env_number('STAR_SHARD_WORKERS', 0, int), metrics=metrics.job('shard-worker'),
+                    **{key: value for key, value in SCRAPER_OPTIONS.items() if key != 'max_workers'}).start()
+
+def create_app():
+    """gunicorn entry point (gunicorn 'app:create_app()'): the app with its background work running."""
+    start_background_work()
+    return app
+
 @app.route('/api/start', methods=['POST'])
 def start_scraper():
     data = request.json
@@ -115,12 +430,107 @@ def start_scraper():
     if not url:
         return jsonify({'error': '請提供網址'}), 400
         
+    sharded = bool(data.get('sharded'))
+    if sharded and not work_queue:
+        return jsonify({'error': 'Sharded crawling is not enabled (STAR_WORK_QUEUE_DB)'}), 400
+
+    try:
+        priority = int(data.get('priority') or 0) # Higher runs first
+    except (TypeError, ValueError):
+        return jsonify({'error': 'priority must be an integer'}), 400
+
     job_id = str(uuid.uuid4())
-    thread = ScraperThread(job_id, url, targets)
-    thread.start()
+    try:
+        submit_job(ScrapeJob(job_id, url, targets, sharded=sharded), priority)
+    except QueueFull:
+        return jsonify({'error': '目前排隊人數過多，請稍後再試'}), 503
     
     return jsonify({'job_id': job_id})
 
+@app.route('/api/reextract', methods=['POST'])
+def reextract():
+    # Rebuild a full result table from the page archive: no network, parsing on every core
+    if 'archive' not in SCRAPER_OPTIONS:
+        return jsonify({'error': 'Page archive is not enabled (STAR_ARCHIVE_DIR)'}), 404
+    data = request.json
+    url = data.get('url')
+    if not url:
+        return jsonify({'error': '請提供網址'}), 400
+
+    job_id = str(uuid.uuid4())
+    try:
+        submit_job(ScrapeJob(job_id, url, data.get('targets'), reextract=True))
+    except QueueFull:
+        return jsonify({'error': '目前排隊人數過多，請稍後再試'}), 503
+    return jsonify({'job_id': job_id})
+
+@app.route('/api/resume/<job_id>', methods=['POST'])
+def resume_scraper(job_id):
+    # Continue an interrupted job from its last checkpoint
+    params = checkpoints.load_params(job_id)
+    if not params:
+        return jsonify({'error': 'No checkpoint for this job'}), 404
+    job = jobs.get(job_id)
+    # A job whose worker died stays 'running' in the store; treat it as interrupted once it stops updating
+    if job and (job['status'] == 'queued' or (
+            job['status'] in ('starting', 'running') and jobs.seconds_since_update(job_id) < STALE_JOB_SECONDS)):
+        return jsonify({'error': 'Job is still running'}), 409
+
+    try:
+        submit_job(ScrapeJob(job_id, params['url'], params.get('targets'), resume=True,
+                             reextract=params.get('reextract', False),
+                             sharded=params.get('sharded', False)))
+    except QueueFull:
+        return jsonify({'error': '目前排隊人數過多，請稍後再試'}), 503
+    return jsonify({'job_id': job_id})
+
+@app.route('/api/retry/<job_id>', methods=['POST'])
+def retry_failures(job_id):
+    # Refetch only the URLs in the job's failure ledger and merge them into its output
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] not in FINISHED_STATUSES:
+        return jsonify({'error': 'Job is still running'}), 409
+    failures = job.get('failures') or []
+    params = checkpoints.load_params(job_id)
+    if not failures or not params:
+        return jsonify({'error': 'Nothing to retry'}), 404
+
+    # Finished rows come from the checkpoint; departments without one are refetched.
+    # Universities whose department list failed are scanned again.
+    retry_universities = [{'name': f.get('uni_name'), 'url': f['url']}
+                          for f in failures if f.get('kind') == 'university']
+    try:
+        submit_job(ScrapeJob(job_id, params['url'], params.get('targets'), resume=True,
+                             retry_universities=retry_universities,
+                             reextract=params.get('reextract', False),
+                             sharded=params.get('sharded', False)))
+    except QueueFull:
+        return jsonify({'error': '目前排隊人數過多，請稍後再試'}), 503
+    return jsonify({'job_id': job_id, 'retrying': len(failures)})
+
+@app.route('/api/cancel/<job_id>', methods=['POST'])
+def cancel_scraper(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] in FINISHED_STATUSES:
+        return jsonify({'error': 'Job already finished'}), 409
+
+    where = scheduler.cancel(job_id)
+    if where == 'queued':
+        jobs.update(job_id, {'status': 'cancelled', 'message': '已取消', 'queue_position': None})
+    else:
+        # Running here (stops at the next page) or owned by another worker, which picks this up
+        jobs.update(job_id, {'cancel_requested': True, 'message': '取消中...'})
+    return jsonify({'job_id': job_id, 'cancelled': where or 'requested'})
+
+@app.route('/api/metrics')
+def get_metrics():
+    # Prometheus text exposition format; each web worker reports its own jobs
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/status/<job_id>')
 def get_status(job_id):
     job = jobs.get(job_id)
@@ -128,6 +538,45 @@ def get_status(job_id):
         return jsonify({'error': 'Job not found'}), 404
     return jsonify(job)
 
+# STAR_MAX_STREAMS: open /api/stream connections per web worker (default 32). Each one holds a
+# request thread until its job ends, so keep it below gunicorn's --threads; clients beyond it poll
+MAX_STREAMS = env_number('STAR_MAX_STREAMS', 32, int)
+stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+@app.route('/api/stream/<job_id>')
+def stream_status(job_id):
+    """
+    Server-Sent Events stream of the job state. Every progress update (and new
+    preview row) is pushed as one `data:` event; the stream ends once the job
+    completes or fails. Answers 503 when MAX_STREAMS are open, which makes the
+    frontend fall back to polling /api/status.
+    """
+    if not jobs.get(job_id):
+        return jsonify({'error': 'Job not found'}), 404
+    if not stream_slots.acquire(blocking=False):
+        return jsonify({'error': 'Too many open streams, poll /api/status instead'}), 503
+
+    def events():
+        version = None
+        while True:
+            new_version, state = jobs.wait_for_change(job_id, version, timeout=15)
+            if state is None:
+                return
+            if new_version == version:
+                # Keep-alive comment so proxies don't close an idle stream
+                yield ': keep-alive\n\n'
+                continue
+            version = new_version
+            yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+            if state['status'] in FINISHED_STATUSES:
+                return
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    response = Response(stream_with_context(events()), mimetype='text/event-stream', headers=headers)
+    # Called when the connection closes, even if the stream never started
+    response.call_on_close(stream_slots.release)
+    return response
+
 @app.route('/api/preview/<job_id>')
 def get_preview(job_id):
     job = jobs.get(job_id)
@@ -138,7 +587,7 @@ def get_preview(job_id):
     # Ideally we should store results in the job dict or access the scraper
     # For simplicity, let's access the scraper if the thread is alive or finished
     # But thread might be gone.
-    # Let's modify the ScraperThread to store results in the job dict upon completion
+    # Let's modify the ScrapeJob to store results in the job dict upon completion
     # or expose the scraper results.
     
     # Actually, the scraper saves to file. We can read the file.
@@ -147,6 +596,119 @@ def get_preview(job_id):
     rows = job.get('preview_data', [])
     return jsonify({'preview': rows})
 
+@app.route('/api/query/<job_id>')
+def query_results(job_id):
+    """
+    Filter, search, sort and paginate a completed job's rows.
+    Filters: any indexed column as a parameter (學群類別, 學校名稱, *檢定標準), repeat it to
+    match several values. q: terms searched in 分發比序項目. sort / order (asc, desc), page, per_page.
+    """
+    job = jobs.get(job_id)
+    if not job or job['status'] != 'completed':
+        return jsonify({'error': 'Results not ready'}), 404
+
+    started = time.perf_counter()
+    index = result_indexes.get(os.path.join(os.getcwd(), job['filename']))
+    filters = {column: request.args.getlist(column) for column in INDEXED_COLUMNS if column in request.args}
+    try:
+        page = max(1, int(request.args.get('page', 1)))
+        per_page = min(200, max(1, int(request.args.get('per_page', 50))))
+        result = index.query(filters, request.args.get('q'), request.args.get('sort'),
+                             request.args.get('order') == 'desc', page, per_page)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    result['took_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return jsonify(result)
+
+@app.route('/api/eligibility/<job_id>', methods=['POST'])
+def match_eligibility(job_id):
+    """
+    Departments of a completed job whose test standards each student reaches.
+    JSON: {"students": [{"id": ..., "國文": "頂標", "英聽": "A級", ...}]} answers with JSON.
+    A CSV upload (form field "file"; a 學生 or id column plus one column per subject)
+    answers with a CSV of every student / department match.
+    """
+    job = jobs.get(job_id)
+    if not job or job['status'] != 'completed':
+        return jsonify({'error': 'Results not ready'}), 404
+
+    upload = request.files.get('file')
+    if upload:
+        students = list(csv.DictReader(io.TextIOWrapper(upload.stream, encoding='utf-8-sig')))
+    else:
+        students = (request.get_json(silent=True) or {}).get('students')
+    if not isinstance(students, list) or not students:
+        return jsonify({'error': '請提供學生資料'}), 400
+    if len(students) > ELIGIBILITY_MAX_STUDENTS:
+        return jsonify({'error': f'一次最多 {ELIGIBILITY_MAX_STUDENTS} 位學生'}), 413
+
+    started = time.perf_counter()
+    index = result_indexes.get(os.path.join(os.getcwd(), job['filename']))
+    matcher = index.derived('eligibility', EligibilityMatcher)
+    matches = matcher.eligible(students)
+    student_ids = [str(s.get('學生') or s.get('id') or s.get('name') or i + 1) for i, s in enumerate(students)]
+
+    if upload:
+        output = io.StringIO()
+        writer = csv.writer(output)
+        writer.writerow(['學生'] + ELIGIBILITY_COLUMNS)
+        for student_id, row_ids in zip(student_ids, matches):
+            for row_id in row_ids:
+                row = index.rows[row_id]
+                writer.writerow([student_id] + [row.get(column, '') for column in ELIGIBILITY_COLUMNS])
+        # utf-8-sig so Excel opens the Chinese headers correctly
+        return send_file(io.BytesIO(output.getvalue().encode('utf-8-sig')), mimetype='text/csv',
+                         as_attachment=True, download_name='繁星檢定符合學系.csv')
+
+    return jsonify({
+        'results': [{
+            'student': student_id,
+            'count': len(row_ids),
+            'departments': [{column: index.rows[row_id].get(column, '') for column in ELIGIBILITY_COLUMNS}
+                            for row_id in row_ids],
+        } for student_id, row_ids in zip(student_ids, matches)],
+        'took_ms': round((time.perf_counter() - started) * 1000, 2),
+    })
+
+@app.route('/api/snapshots', methods=['GET', 'POST'])
+def snapshot_list():
+    """GET lists the snapshots. POST {"job_id", "date"?} stores a completed job's rows as the snapshot of date (default today)."""
+    if not snapshots:
+        return jsonify({'error': 'Snapshots are not enabled (STAR_SNAPSHOT_DIR)'}), 404
+    if request.method == 'GET':
+        return jsonify({'snapshots': snapshots.list()})
+
+    data = request.json or {}
+    job = jobs.get(data.get('job_id'))
+    if not job or job['status'] != 'completed':
+        return jsonify({'error': 'Results not ready'}), 404
+    date = data.get('date') or time.strftime('%Y-%m-%d')
+    index = result_indexes.get(os.path.join(os.getcwd(), job['filename']))
+    try:
+        snapshots.save(date, index.rows)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'date': date, 'rows': len(index.rows)})
+
+@app.route('/api/snapshots/diff')
+def snapshot_diff():
+    """Added / removed departments and quota / standard changes between ?from=DATE and ?to=DATE (default: the last two)."""
+    if not snapshots:
+        return jsonify({'error': 'Snapshots are not enabled (STAR_SNAPSHOT_DIR)'}), 404
+    dates = snapshots.dates()
+    old_date = request.args.get('from') or (dates[-2] if len(dates) >= 2 else None)
+    new_date = request.args.get('to') or (dates[-1] if dates else None)
+    if not old_date or not new_date:
+        return jsonify({'error': 'Need two snapshots to compare'}), 404
+    try:
+        result = snapshots.diff(old_date, new_date)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except KeyError as e:
+        return jsonify({'error': f'No snapshot for {e.args[0]}'}), 404
+    result.update({'from': old_date, 'to': new_date})
+    return jsonify(result)
+
 @app.route('/api/download/<job_id>')
 def download_file(job_id):
     job = jobs.get(job_id)
@@ -154,9 +716,12 @@ def download_file(job_id):
         return jsonify({'error': 'File not ready'}), 404
         
     path = os.path.join(os.getcwd(), job['filename'])
-    return send_file(path, as_attachment=True, download_name='大學繁星校系分則分析.xlsx')
+    extension = os.path.splitext(job['filename'])[1]
+    return send_file(path, as_attachment=True, download_name=f'大學繁星校系分則分析{extension}')
 
 if __name__ == '__main__':
+    # Needed for the parse process pool in the PyInstaller build
+    multiprocessing.freeze_support()
     port = int(os.environ.get('PORT', 5002))
     
     def open_browser():
@@ -178,6 +743,10 @@ if __name__ == '__main__':
     if is_frozen:
         threading.Thread(target=open_browser).start()
         
+    # With the reloader the serving child runs the crawls, not the file watcher
+    if is_frozen or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_work()
+
     # In frozen mode, debug must be False to avoid reloader/debugger issues
     # that cause restarts or weird behavior like auto-refreshing browser.
     app.run(host='0.0.0.0', port=port, debug=not is_frozen, use_reloader=not is_frozen)
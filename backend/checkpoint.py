@@ -0,0 +1,138 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class CheckpointStore:
+    """
+    Local sqlite store of crawl progress, so an interrupted job can resume:
+    the job parameters, the department list discovered so far, the universities
+    still to scan and every finished row.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                job_id TEXT PRIMARY KEY,
+                params_json TEXT NOT NULL,
+                departments_json TEXT,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_rows (
+                job_id TEXT NOT NULL,
+                idx INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                PRIMARY KEY (job_id, idx)
+            );
+            CREATE TABLE IF NOT EXISTS checkpoint_unscanned (
+                job_id TEXT PRIMARY KEY,
+                universities_json TEXT NOT NULL
+            );
+        """)
+        self.db.commit()
+
+    def job(self, job_id, flush_every=25, flush_interval=5.0):
+        return JobCheckpoint(self, job_id, flush_every, flush_interval)
+
+    def save_params(self, job_id, params):
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO checkpoints (job_id, params_json, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET params_json = excluded.params_json, updated_at = excluded.updated_at",
+                (job_id, json.dumps(params, ensure_ascii=False), time.time())
+            )
+            self.db.commit()
+
+    def load_params(self, job_id):
+        with self.lock:
+            found = self.db.execute("SELECT params_json FROM checkpoints WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def save_departments(self, job_id, departments, unscanned=None):
+        """
+        departments: the department list discovered so far (rows are indexed into it);
+        unscanned: universities whose departments come after it, None once discovery finished.
+        """
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO checkpoints (job_id, params_json, departments_json, updated_at) VALUES (?, '{}', ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET departments_json = excluded.departments_json, updated_at = excluded.updated_at",
+                (job_id, json.dumps(departments, ensure_ascii=False), time.time())
+            )
+            if unscanned:
+                self.db.execute(
+                    "INSERT OR REPLACE INTO checkpoint_unscanned VALUES (?, ?)",
+                    (job_id, json.dumps(unscanned, ensure_ascii=False))
+                )
+            else:
+                self.db.execute("DELETE FROM checkpoint_unscanned WHERE job_id = ?", (job_id,))
+            self.db.commit()
+
+    def save_rows(self, job_id, rows):
+        # rows: [(index, url, row)]
+        with self.lock:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO checkpoint_rows VALUES (?, ?, ?, ?)",
+                [(job_id, idx, url, json.dumps(row, ensure_ascii=False)) for idx, url, row in rows]
+            )
+            self.db.execute("UPDATE checkpoints SET updated_at = ? WHERE job_id = ?", (time.time(), job_id))
+            self.db.commit()
+
+    def load(self, job_id):
+        """
+        Return (departments, {index: row}, unscanned universities), or (None, {}, []) if
+        no department list was saved. unscanned is [] once discovery finished.
+        """
+        with self.lock:
+            found = self.db.execute("SELECT departments_json FROM checkpoints WHERE job_id = ?", (job_id,)).fetchone()
+            if not found or found[0] is None:
+                return None, {}, []
+            rows = self.db.execute(
+                "SELECT idx, row_json FROM checkpoint_rows WHERE job_id = ?", (job_id,)
+            ).fetchall()
+            unscanned = self.db.execute(
+                "SELECT universities_json FROM checkpoint_unscanned WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return (json.loads(found[0]), {idx: json.loads(row_json) for idx, row_json in rows},
+                json.loads(unscanned[0]) if unscanned else [])
+
+    def discard(self, job_id):
+        with self.lock:
+            self.db.execute("DELETE FROM checkpoint_rows WHERE job_id = ?", (job_id,))
+            self.db.execute("DELETE FROM checkpoint_unscanned WHERE job_id = ?", (job_id,))
+            self.db.execute("DELETE FROM checkpoints WHERE job_id = ?", (job_id,))
+            self.db.commit()
+
+
+class JobCheckpoint:
+    """Checkpoint of one job; finished rows are buffered and written every few rows / seconds."""
+
+    def __init__(self, store, job_id, flush_every=25, flush_interval=5.0):
+        self.store = store
+        self.job_id = job_id
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def load(self):
+        return self.store.load(self.job_id)
+
+    def save_departments(self, departments, unscanned=None):
+        self.store.save_departments(self.job_id, departments, unscanned)
+
+    def record(self, index, url, row):
+        self.pending.append((index, url, row))
+        if len(self.pending) >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.store.save_rows(self.job_id, self.pending)
+            self.pending = []
+        self.last_flush = time.monotonic()
@@ -0,0 +1,172 @@
+import re
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # optional dependency
+    pa = pq = None
+
+from page_parser import SUBJECTS
+from sinks import RowSink
+
+# Test standard levels, highest first. The dictionary index is the categorical code,
+# so codes are stable across files.
+STANDARD_LEVELS = ['頂標', '前標', '均標', '後標', '底標']
+LISTENING_LEVELS = ['A級', 'B級', 'C級', 'F級']
+
+QUOTA_COLUMNS = ['招生名額', '外加名額']
+VOLUNTEER_COLUMNS = ['招生名額各學群可選填志願數', '外加名額各學群可選填志願數']
+RANK_COLUMNS = [f'分發比序項目{i}' for i in range(1, 9)]
+
+
+def require_pyarrow():
+    if pa is None:
+        raise ImportError("Parquet / Arrow export needs pyarrow (pip install pyarrow)")
+
+
+def standard_levels(subject):
+    return LISTENING_LEVELS if subject == '英聽' else STANDARD_LEVELS
+
+
+def parse_count(value):
+    """'6' -> 6, '無' -> 0, '--' / '' -> None."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    if value == '無':
+        return 0
+    match = re.search(r'\d+', value)
+    return int(match.group()) if match else None
+
+
+def standard_code(value, levels):
+    """Index of the level in levels; None for '--', empty or unknown values."""
+    value = (value or '').strip()
+    return levels.index(value) if value in levels else None
+
+
+def schema():
+    require_pyarrow()
+    fields = [
+        pa.field('學校名稱', pa.string()),
+        pa.field('學系名稱', pa.string()),
+        pa.field('校系代碼', pa.string()),
+        pa.field('學群類別', pa.string()),
+    ]
+    fields += [pa.field(column, pa.int32()) for column in QUOTA_COLUMNS]
+    fields += [pa.field(column, pa.int32()) for column in VOLUNTEER_COLUMNS]
+    fields += [pa.field(f'{subject}檢定標準', pa.dictionary(pa.int8(), pa.string(), ordered=True)) for subject in SUBJECTS]
+    fields += [
+        pa.field('分發比序項目', pa.list_(pa.string())),
+        pa.field('資料連結', pa.string()),
+    ]
+    return pa.schema(fields)
+
+
+def rows_to_batch(rows):
+    """Convert scraper rows (all strings) into a typed RecordBatch."""
+    require_pyarrow()
+    arrays = [
+        pa.array([row.get('學校名稱', '') for row in rows], pa.string()),
+        pa.array([row.get('學系名稱', '') for row in rows], pa.string()),
+        pa.array([row.get('校系代碼', '') for row in rows], pa.string()),
+        pa.array([row.get('學群類別', '') for row in rows], pa.string()),
+    ]
+    for column in QUOTA_COLUMNS + VOLUNTEER_COLUMNS:
+        arrays.append(pa.array([parse_count(row.get(column)) for row in rows], pa.int32()))
+    for subject in SUBJECTS:
+        levels = standard_levels(subject)
+        codes = [standard_code(row.get(f'{subject}檢定標準'), levels) for row in rows]
+        # Fixed dictionary: the same level always has the same code
+        arrays.append(pa.DictionaryArray.from_arrays(
+            pa.array(codes, pa.int8()), pa.array(levels, pa.string()), ordered=True))
+    arrays.append(pa.array([rank_items(row) for row in rows], pa.list_(pa.string())))
+    arrays.append(pa.array([row.get('資料連結', '') for row in rows], pa.string()))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema())
+
+
+class BatchingSink(RowSink):
+    """Buffers rows and writes them as record batches of batch_size rows."""
+
+    def __init__(self, batch_size=1000):
+        require_pyarrow()
+        self.batch_size = batch_size
+        self.buffer = []
+
+    def write(self, row):
+        self.buffer.append(row)
+        if len(self.buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.write_batch(rows_to_batch(self.buffer))
+            self.buffer = []
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+
+class ParquetSink(BatchingSink):
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.path = path
+        self.writer = pq.ParquetWriter(path, schema())
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class ArrowSink(BatchingSink):
+    """Arrow IPC file; readers can memory-map it with pyarrow.memory_map + ipc.open_file."""
+
+    def __init__(self, path, batch_size=1000):
+        super().__init__(batch_size)
+        self.path = path
+        self.file = pa.OSFile(path, 'wb')
+        self.writer = pa.ipc.new_file(self.file, schema())
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.file.close()
+
+
+def rank_items(row):
+    """分發比序項目1..8 as a list; blanks inside it are null so later items keep their position."""
+    items = [row.get(column) or None for column in RANK_COLUMNS]
+    while items and items[-1] is None:
+        items.pop()
+    return items
+
+
+def read_rows(path):
+    """
+    Read a Parquet or Arrow file back into scraper-style string rows. Values come back
+    normalized: '無' quotas read as '0' and unknown standards as ''.
+    """
+    require_pyarrow()
+    if path.lower().endswith('.parquet'):
+        table = pq.read_table(path)
+    else:
+        with pa.memory_map(path) as source:
+            table = pa.ipc.open_file(source).read_all()
+    rows = []
+    for record in table.to_pylist():
+        row = {}
+        for column, value in record.items():
+            if column == '分發比序項目':
+                items = value or []
+                for i, rank_column in enumerate(RANK_COLUMNS):
+                    row[rank_column] = (items[i] if i < len(items) else None) or ''
+            else:
+                row[column] = '' if value is None else str(value)
+        rows.append(row)
+    return rows
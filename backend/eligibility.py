@@ -0,0 +1,55 @@
+import numpy as np
+
+from columnar import standard_levels
+from page_parser import SUBJECTS
+from result_index import STANDARD_COLUMNS
+
+
+def level_code(subject, value):
+    """
+    Ordinal code of a level: the lowest level is 1, each higher level adds 1
+    (底標=1 ... 頂標=5, F級=1 ... A級=4). No requirement or no score is 0.
+    """
+    levels = standard_levels(subject)
+    value = (value or '').strip()
+    if subject == '英聽' and len(value) == 1:
+        value += '級'  # 'A' -> 'A級'
+    return len(levels) - levels.index(value) if value in levels else 0
+
+
+class EligibilityMatcher:
+    """
+    Department test standards as an int8 matrix (departments x subjects) of ordinal codes.
+    A student passes a department when their level reaches every standard it sets, so
+    matching is a vectorized >= comparison of student and department rows per subject.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.required = np.array(
+            [[level_code(subject, row.get(column)) for subject, column in zip(SUBJECTS, STANDARD_COLUMNS)]
+             for row in rows],
+            dtype=np.int8,
+        ).reshape(len(rows), len(SUBJECTS))
+
+    def encode(self, profiles):
+        """Student levels ({subject or column name: level}) as a students x subjects matrix."""
+        return np.array(
+            [[level_code(subject, profile.get(subject) or profile.get(column))
+              for subject, column in zip(SUBJECTS, STANDARD_COLUMNS)]
+             for profile in profiles],
+            dtype=np.int8,
+        ).reshape(len(profiles), len(SUBJECTS))
+
+    def match(self, profiles):
+        """Boolean students x departments matrix: True where the student passes every standard."""
+        students = self.encode(profiles)
+        passed = np.ones((len(students), len(self.rows)), dtype=bool)
+        # One students x departments comparison per subject; subjects no department uses are skipped
+        for k in np.flatnonzero(self.required.any(axis=0)):
+            passed &= students[:, k, None] >= self.required[None, :, k]
+        return passed
+
+    def eligible(self, profiles):
+        """For every profile, the indexes of the rows (departments) it passes."""
+        return [np.flatnonzero(row) for row in self.match(profiles)]
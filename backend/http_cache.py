@@ -0,0 +1,163 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+
+class HttpCache:
+    """
+    On-disk HTTP response cache.
+
+    The index (sqlite) is keyed by URL and stores the validators (ETag /
+    Last-Modified) of each response; bodies are stored content-addressed under
+    objects/<sha256>, so identical pages are kept only once.
+
+    :param ttl: Seconds a stored response is used without asking the server.
+                After that it is revalidated with a conditional GET. 0 = always revalidate.
+    :param max_age: Seconds after which an entry is evicted entirely (None = never).
+    :param max_bytes: Evict least recently used entries beyond this total body size (None = unbounded).
+    """
+
+    def __init__(self, cache_dir, ttl=3600, max_age=None, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.objects_dir = os.path.join(cache_dir, 'objects')
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self.ttl = ttl
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'index.sqlite'), check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self.db.commit()
+
+    def _object_path(self, content_hash):
+        return os.path.join(self.objects_dir, content_hash[:2], content_hash)
+
+    def get(self, url):
+        """Return the cached entry for url (with its 'text') or None."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT content_hash, etag, last_modified, fetched_at FROM entries WHERE url = ?", (url,)
+            ).fetchone()
+            if not row:
+                return None
+            content_hash, etag, last_modified, fetched_at = row
+            if self.max_age is not None and time.time() - fetched_at > self.max_age:
+                self._delete(url, content_hash)
+                self.db.commit()
+                return None
+            try:
+                with open(self._object_path(content_hash), encoding='utf-8') as f:
+                    text = f.read()
+            except OSError:
+                # Body went missing; forget the entry
+                self._delete(url, content_hash)
+                self.db.commit()
+                return None
+            self.db.execute("UPDATE entries SET last_access = ? WHERE url = ?", (time.time(), url))
+            self.db.commit()
+        return {
+            'url': url,
+            'text': text,
+            'content_hash': content_hash,
+            'etag': etag,
+            'last_modified': last_modified,
+            'fetched_at': fetched_at,
+        }
+
+    def is_fresh(self, entry):
+        return self.ttl is not None and time.time() - entry['fetched_at'] < self.ttl
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, url, text, etag=None, last_modified=None):
+        body = text.encode('utf-8')
+        content_hash = hashlib.sha256(body).hexdigest()
+        path = self._object_path(content_hash)
+        now = time.time()
+        with self.lock:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(body)
+                os.replace(tmp_path, path)
+            old = self.db.execute("SELECT content_hash FROM entries WHERE url = ?", (url,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (url, content_hash, etag, last_modified, now, now, len(body))
+            )
+            if old and old[0] != content_hash:
+                self._drop_object_if_unused(old[0])
+            self.db.commit()
+        self.evict()
+        return content_hash
+
+    def touch(self, url):
+        # The server confirmed (304) that our copy is still current
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE entries SET fetched_at = ?, last_access = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+
+    def evict(self):
+        with self.lock:
+            if self.max_age is not None:
+                expired = self.db.execute(
+                    "SELECT url, content_hash FROM entries WHERE fetched_at < ?", (time.time() - self.max_age,)
+                ).fetchall()
+                for url, content_hash in expired:
+                    self._delete(url, content_hash)
+
+            if self.max_bytes is not None:
+                total = self.db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT content_hash, size FROM entries)"
+                ).fetchone()[0]
+                if total > self.max_bytes:
+                    rows = self.db.execute(
+                        "SELECT url, content_hash, size FROM entries ORDER BY last_access"
+                    ).fetchall()
+                    for url, content_hash, size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        if self._delete(url, content_hash):
+                            total -= size
+            self.db.commit()
+
+    def _delete(self, url, content_hash):
+        # Returns True when the body file itself was removed
+        self.db.execute("DELETE FROM entries WHERE url = ?", (url,))
+        return self._drop_object_if_unused(content_hash)
+
+    def _drop_object_if_unused(self, content_hash):
+        in_use = self.db.execute(
+            "SELECT 1 FROM entries WHERE content_hash = ? LIMIT 1", (content_hash,)
+        ).fetchone()
+        if in_use:
+            return False
+        try:
+            os.remove(self._object_path(content_hash))
+        except OSError:
+            pass
+        return True
+
+    def close(self):
+        with self.lock:
+            self.db.close()
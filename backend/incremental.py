@@ -0,0 +1,73 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class DepartmentStore:
+    """
+    Remembers, per department URL, the hash of the page it was parsed from and
+    the resulting row, so unchanged pages can skip parsing on the next crawl.
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS departments (
+                url TEXT PRIMARY KEY,
+                uni_url TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                row_json TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS departments_uni ON departments (uni_url)")
+        self.db.commit()
+
+    def lookup(self, url):
+        """Return (content_hash, row) stored for url, or (None, None)."""
+        with self.lock:
+            found = self.db.execute(
+                "SELECT content_hash, row_json FROM departments WHERE url = ?", (url,)
+            ).fetchone()
+        if not found:
+            return None, None
+        return found[0], json.loads(found[1])
+
+    def save(self, url, uni_url, page_hash, row):
+        with self.lock:
+            self.db.execute(
+                "INSERT OR REPLACE INTO departments VALUES (?, ?, ?, ?, ?)",
+                (url, uni_url, page_hash, json.dumps(row, ensure_ascii=False), time.time())
+            )
+            self.db.commit()
+
+    def remove_missing(self, uni_urls, seen_urls):
+        """
+        Delete departments of the given universities that were not seen in this
+        crawl. Returns the number of removed departments.
+        """
+        seen_urls = set(seen_urls)
+        removed = []
+        with self.lock:
+            for uni_url in uni_urls:
+                for (url,) in self.db.execute("SELECT url FROM departments WHERE uni_url = ?", (uni_url,)).fetchall():
+                    if url not in seen_urls:
+                        removed.append(url)
+            self.db.executemany("DELETE FROM departments WHERE url = ?", [(url,) for url in removed])
+            self.db.commit()
+        return len(removed)
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,94 @@
+import heapq
+import itertools
+import threading
+
+
+class QueueFull(Exception):
+    pass
+
+
+class JobScheduler:
+    """
+    Fixed pool of worker threads running queued jobs, at most max_concurrent at a time.
+
+    A job is any object with run() and cancel(). Higher priority runs first,
+    equal priorities run in submission order. on_queue_change(positions) is
+    called with {job_id: 1-based position} whenever the waiting line changes.
+    Jobs submitted before start() wait until it is called.
+    """
+
+    def __init__(self, max_concurrent=2, max_queued=50, on_queue_change=None):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.on_queue_change = on_queue_change
+        self.cond = threading.Condition()
+        self.queue = []  # heap of (-priority, seq, job_id, job)
+        self.seq = itertools.count()
+        self.running = {}
+        self.workers = []
+
+    def start(self):
+        """Start the worker threads."""
+        for i in range(self.max_concurrent):
+            worker = threading.Thread(target=self.worker_loop, name=f"scrape-worker-{i}", daemon=True)
+            worker.start()
+            self.workers.append(worker)
+
+    def submit(self, job_id, job, priority=0):
+        """Queue a job; raises QueueFull when max_queued jobs are already waiting (admission control)."""
+        with self.cond:
+            if len(self.queue) >= self.max_queued:
+                raise QueueFull(f"{len(self.queue)} jobs already waiting")
+            heapq.heappush(self.queue, (-priority, next(self.seq), job_id, job))
+            self.cond.notify()
+        self.publish_positions()
+
+    def positions(self):
+        with self.cond:
+            ordered = sorted(self.queue)
+        return {job_id: i + 1 for i, (_, _, job_id, _) in enumerate(ordered)}
+
+    def position(self, job_id):
+        return self.positions().get(job_id)
+
+    def cancel(self, job_id):
+        """
+        Returns 'queued' if the job was removed from the queue, 'running' if a
+        running job was asked to stop, or None if this scheduler doesn't have it.
+        """
+        with self.cond:
+            for i, entry in enumerate(self.queue):
+                if entry[2] == job_id:
+                    self.queue.pop(i)
+                    heapq.heapify(self.queue)
+                    break
+            else:
+                job = self.running.get(job_id)
+                if job is None:
+                    return None
+                job.cancel()
+                return 'running'
+        entry[3].cancel()
+        self.publish_positions()
+        return 'queued'
+
+    def worker_loop(self):
+        while True:
+            with self.cond:
+                while not self.queue:
+                    self.cond.wait()
+                _, _, job_id, job = heapq.heappop(self.queue)
+                self.running[job_id] = job
+            self.publish_positions()
+            try:
+                job.run()
+            except Exception:
+                # Jobs report their own errors; never let one kill the worker
+                pass
+            finally:
+                with self.cond:
+                    self.running.pop(job_id, None)
+
+    def publish_positions(self):
+        if self.on_queue_change:
+            self.on_queue_change(self.positions())
@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import threading
+import time
+
+
+class SqliteJobStore:
+    """
+    Job state shared by every gunicorn worker (and surviving restarts).
+    Each job is a JSON document: status, progress, message, preview rows, output file...
+    """
+
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        # Wakes up streaming readers in this process as soon as a job changes
+        self.changed = threading.Condition()
+        # Several processes write this file; wait for their locks instead of failing
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                state_json TEXT NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+
+    def create(self, job_id, state):
+        """Store a new job, or replace an existing job's whole state (its version still increases)."""
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT INTO jobs (job_id, state_json, version, created_at, updated_at) VALUES (?, ?, 0, ?, ?) "
+                "ON CONFLICT(job_id) DO UPDATE SET state_json = excluded.state_json, version = version + 1, "
+                "updated_at = excluded.updated_at",
+                (job_id, json.dumps(state, ensure_ascii=False), now, now)
+            )
+        with self.changed:
+            self.changed.notify_all()
+
+    def get(self, job_id):
+        with self.lock:
+            found = self.db.execute("SELECT state_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def get_versioned(self, job_id):
+        """Return (version, state); version increases on every update. (None, None) if unknown."""
+        with self.lock:
+            found = self.db.execute("SELECT version, state_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return (found[0], json.loads(found[1])) if found else (None, None)
+
+    def wait_for_change(self, job_id, version, timeout):
+        """
+        Block until the job's version differs from `version` or timeout passes.
+        Updates made in this process wake the waiter immediately; updates from
+        other workers are picked up by re-reading the row every half second.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            current, state = self.get_versioned(job_id)
+            remaining = deadline - time.monotonic()
+            if current != version or remaining <= 0:
+                return current, state
+            with self.changed:
+                self.changed.wait(min(remaining, 0.5))
+
+    def seconds_since_update(self, job_id):
+        with self.lock:
+            found = self.db.execute("SELECT updated_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return time.time() - found[0] if found else None
+
+    def update(self, job_id, fields):
+        """Merge fields into the job state. Returns the new state, or None if the job does not exist."""
+        with self.lock:
+            # IMMEDIATE takes the write lock up front so concurrent updates from other workers cannot interleave
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                found = self.db.execute("SELECT state_json FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+                if not found:
+                    self.db.execute("ROLLBACK")
+                    return None
+                state = json.loads(found[0])
+                state.update(fields)
+                self.db.execute(
+                    "UPDATE jobs SET state_json = ?, version = version + 1, updated_at = ? WHERE job_id = ?",
+                    (json.dumps(state, ensure_ascii=False), time.time(), job_id)
+                )
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        with self.changed:
+            self.changed.notify_all()
+        return state
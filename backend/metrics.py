@@ -0,0 +1,175 @@
+import threading
+from collections import OrderedDict
+
+# Seconds; covers sub-millisecond parses up to slow retried fetches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help). Rendered as star_<name> (all jobs of this process) and star_job_<name>{job=...}
+FAMILIES = OrderedDict([
+    ('fetch_requests_total', ('counter', "HTTP fetch attempts by outcome (ok, not_modified, cache_hit, archive, busy, error)")),
+    ('fetch_retries_total', ('counter', "Fetch attempts that were retries")),
+    ('fetch_bytes_total', ('counter', "Response body bytes received")),
+    ('fetch_seconds', ('histogram', "Network time per HTTP request, including the body download")),
+    ('throttle_wait_seconds', ('histogram', "Time spent waiting for the rate limiter before a request")),
+    ('backoff_seconds_total', ('counter', "Time spent sleeping before retries")),
+    ('parse_seconds', ('histogram', "Parse time by stage (tree, index, extract_* steps, department_links)")),
+    ('departments_total', ('counter', "Department pages processed by result (new, changed, unchanged, failed)")),
+    ('rows_total', ('counter', "Rows emitted")),
+    ('failures_total', ('counter', "URLs given up on, by stage (fetch, parse)")),
+])
+
+
+class MetricSet:
+    """Thread-safe counters and histograms keyed by (name, labels)."""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}  # key -> [bucket counts..., sum, count]
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    histogram[i] += 1
+                    break
+            histogram[-2] += value
+            histogram[-1] += 1
+
+    def total(self, name, **labels):
+        """Sum of a counter, or of a histogram's observations, over every label set matching labels."""
+        wanted = set(labels.items())
+        with self.lock:
+            if name in FAMILIES and FAMILIES[name][0] == 'histogram':
+                return sum(h[-2] for (n, l), h in self.histograms.items() if n == name and wanted <= set(l))
+            return sum(v for (n, l), v in self.counters.items() if n == name and wanted <= set(l))
+
+    def render(self, prefix, extra_labels=()):
+        """Prometheus text lines for every family, without HELP/TYPE headers."""
+        lines = {name: [] for name in FAMILIES}
+        with self.lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines[name].append(f"{prefix}{name}{format_labels(extra_labels + labels)} {format_value(value)}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram):
+                    cumulative += count
+                    bucket_labels = format_labels(extra_labels + labels + (('le', format_value(bound)),))
+                    lines[name].append(f"{prefix}{name}_bucket{bucket_labels} {cumulative}")
+                inf_labels = format_labels(extra_labels + labels + (('le', '+Inf'),))
+                lines[name].append(f"{prefix}{name}_bucket{inf_labels} {histogram[-1]}")
+                lines[name].append(f"{prefix}{name}_sum{format_labels(extra_labels + labels)} {format_value(histogram[-2])}")
+                lines[name].append(f"{prefix}{name}_count{format_labels(extra_labels + labels)} {histogram[-1]}")
+        return lines
+
+
+class JobMetrics(MetricSet):
+    """Metrics of one crawl; every observation is also added to the parent (process-wide) set."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent.buckets if parent else DEFAULT_BUCKETS)
+        self.parent = parent
+
+    def inc(self, name, value=1, **labels):
+        super().inc(name, value, **labels)
+        if self.parent:
+            self.parent.inc(name, value, **labels)
+
+    def observe(self, name, value, **labels):
+        super().observe(name, value, **labels)
+        if self.parent:
+            self.parent.observe(name, value, **labels)
+
+    def summary(self):
+        """Where the time went, for the job state."""
+        return {
+            'requests': self.total('fetch_requests_total'),
+            'retries': self.total('fetch_retries_total'),
+            'busy': self.total('fetch_requests_total', outcome='busy'),
+            'bytes': self.total('fetch_bytes_total'),
+            'network_seconds': round(self.total('fetch_seconds'), 3),
+            'throttle_seconds': round(self.total('throttle_wait_seconds'), 3),
+            'backoff_seconds': round(self.total('backoff_seconds_total'), 3),
+            'parse_seconds': round(self.total('parse_seconds'), 3),
+        }
+
+
+class MetricsRegistry:
+    """
+    Process-wide metrics: an aggregate MetricSet, the per-job sets of the last
+    keep_jobs jobs, and gauges computed on scrape by callables returning
+    {labels tuple: value}.
+    """
+
+    def __init__(self, keep_jobs=20):
+        self.aggregate = MetricSet()
+        self.keep_jobs = keep_jobs
+        self.lock = threading.Lock()
+        self.jobs = OrderedDict()
+        self.gauges = []
+
+    def job(self, job_id):
+        with self.lock:
+            metrics = self.jobs.get(job_id)
+            if metrics is None:
+                metrics = self.jobs[job_id] = JobMetrics(self.aggregate)
+                while len(self.jobs) > self.keep_jobs:
+                    self.jobs.popitem(last=False)
+            return metrics
+
+    def gauge(self, name, help_text, fn, metric_type='gauge'):
+        self.gauges.append((name, help_text, fn, metric_type))
+
+    def render(self):
+        out = []
+        with self.lock:
+            jobs = list(self.jobs.items())
+        aggregate_lines = self.aggregate.render('star_')
+        job_lines = [metrics.render('star_job_', (('job', job_id),)) for job_id, metrics in jobs]
+
+        for name, (metric_type, help_text) in FAMILIES.items():
+            out.append(f"# HELP star_{name} {help_text} (all jobs)")
+            out.append(f"# TYPE star_{name} {metric_type}")
+            out.extend(aggregate_lines[name])
+        for name, (metric_type, help_text) in FAMILIES.items():
+            out.append(f"# HELP star_job_{name} {help_text} (per job)")
+            out.append(f"# TYPE star_job_{name} {metric_type}")
+            for lines in job_lines:
+                out.extend(lines[name])
+
+        for name, help_text, fn, metric_type in self.gauges:
+            out.append(f"# HELP star_{name} {help_text}")
+            out.append(f"# TYPE star_{name} {metric_type}")
+            try:
+                values = fn()
+            except Exception:
+                continue
+            for labels, value in sorted(values.items()):
+                out.append(f"star_{name}{format_labels(labels)} {format_value(value)}")
+        return '\n'.join(out) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return repr(value) if value != int(value) else f"{value:.1f}"
+    return str(value)
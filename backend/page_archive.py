@@ -0,0 +1,256 @@
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, zlib is used without it
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Record: magic, codec, url length, body length, body digest, fetched_at; then url, compressed body
+RECORD = struct.Struct('<4sBIIQd')
+RECORD_MAGIC = b'SPRC'
+# Index: magic, version, slot count, used slots; then slots of (url key, record offset, body digest)
+INDEX_HEADER = struct.Struct('<4sIQQ')
+INDEX_MAGIC = b'SPIX'
+SLOT = struct.Struct('<QQQ')
+
+
+def digest64(data):
+    # Never 0, which marks an empty slot
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little') | 1
+
+
+def try_lock(file):
+    """Take an exclusive lock on an open file without waiting; it is released when the process exits."""
+    try:
+        if fcntl:
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(file.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+class PageArchive:
+    """
+    Append-only archive of fetched pages, for re-extraction without the network.
+
+    pages.dat holds one record per stored page version. Each body is compressed on its
+    own (zstd when installed, zlib otherwise), so reading a page decompresses only that
+    page. pages.idx is a memory-mapped open-addressing hash table url -> latest record
+    offset, so get() is one slot probe plus one read. Bodies identical to the stored
+    version are not appended again. If the index is lost it is rebuilt from pages.dat.
+
+    Every process may open the archive, but only the one holding the lock on pages.lock
+    writes; put() in the others is skipped until the writer exits and one of them takes
+    over. Readers reopen the index when the writer replaces it with a larger one.
+    """
+
+    def __init__(self, directory, initial_slots=1 << 14):
+        os.makedirs(directory, exist_ok=True)
+        self.data_path = os.path.join(directory, 'pages.dat')
+        self.index_path = os.path.join(directory, 'pages.idx')
+        self.initial_slots = initial_slots
+        self.lock = threading.Lock()
+        self.lock_file = open(os.path.join(directory, 'pages.lock'), 'a+b')
+        self.data = open(self.data_path, 'a+b')
+        self.compressor = zstandard.ZstdCompressor(level=9) if zstandard else None
+        self.index = None
+        self.writable = False
+        with self.lock:
+            self.take_writer_lock()
+            if not self.writable and os.path.exists(self.index_path):
+                self.open_index()
+
+    def take_writer_lock(self):
+        """Become the writer if no other process is; returns whether this process writes."""
+        if not self.writable and try_lock(self.lock_file):
+            self.writable = True
+            if self.index:
+                self.close_index()
+            if not os.path.exists(self.index_path):
+                # Built aside and renamed so readers never open a half-built index
+                temp_path = self.index_path + '.tmp'
+                self.create_index(temp_path, self.initial_slots)
+                self.open_index(temp_path)
+                self.rebuild_index()
+                self.close_index()
+                os.replace(temp_path, self.index_path)
+            self.open_index()
+        return self.writable
+
+    def create_index(self, path, slots):
+        with open(path, 'wb') as f:
+            f.write(INDEX_HEADER.pack(INDEX_MAGIC, 1, slots, 0))
+            f.truncate(INDEX_HEADER.size + slots * SLOT.size)
+
+    def open_index(self, path=None):
+        path = self.open_path = path or self.index_path
+        if self.writable:
+            self.index_file = open(path, 'r+b')
+            self.index = mmap.mmap(self.index_file.fileno(), 0)
+        else:
+            self.index_file = open(path, 'rb')
+            self.index = mmap.mmap(self.index_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, _, self.slots, self.used = INDEX_HEADER.unpack_from(self.index, 0)
+        if magic != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a page archive index")
+
+    def close_index(self):
+        self.index.close()
+        self.index_file.close()
+        self.index = None
+
+    def refresh_index(self):
+        """Readers: follow the writer's index once it was created or replaced (see grow)."""
+        if self.writable:
+            return
+        try:
+            current = os.stat(self.index_path)
+        except FileNotFoundError:
+            return
+        if self.index and os.fstat(self.index_file.fileno()).st_ino == current.st_ino:
+            self.used = INDEX_HEADER.unpack_from(self.index, 0)[3]
+            return
+        if self.index:
+            self.close_index()
+        self.open_index()
+
+    def close(self):
+        with self.lock:
+            if self.index:
+                self.close_index()
+            self.data.close()
+            self.lock_file.close()
+
+    def find_slot(self, key):
+        """(slot number, offset, digest) of key, or of the empty slot where it would go."""
+        slot = key % self.slots
+        while True:
+            found_key, offset, digest = SLOT.unpack_from(self.index, INDEX_HEADER.size + slot * SLOT.size)
+            if found_key in (0, key):
+                return slot, (offset if found_key else None), digest
+            slot = (slot + 1) % self.slots
+
+    def set_slot(self, slot, key, offset, digest, new):
+        SLOT.pack_into(self.index, INDEX_HEADER.size + slot * SLOT.size, key, offset, digest)
+        if new:
+            self.used += 1
+            INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, 1, self.slots, self.used)
+            if self.used * 2 > self.slots:
+                self.grow()
+
+    def grow(self):
+        # Rehash into a table twice the size, then swap it in
+        entries = [SLOT.unpack_from(self.index, INDEX_HEADER.size + slot * SLOT.size) for slot in range(self.slots)]
+        path = self.open_path
+        temp_path = path + '.grow'
+        self.create_index(temp_path, self.slots * 2)
+        self.close_index()
+        os.replace(temp_path, path)
+        self.open_index(path)
+        for key, offset, digest in entries:
+            if key:
+                slot, _, _ = self.find_slot(key)
+                SLOT.pack_into(self.index, INDEX_HEADER.size + slot * SLOT.size, key, offset, digest)
+                self.used += 1
+        INDEX_HEADER.pack_into(self.index, 0, INDEX_MAGIC, 1, self.slots, self.used)
+
+    def rebuild_index(self):
+        """Index every record of pages.dat; later versions of a URL win."""
+        for url, body_digest, offset in self.scan():
+            key = digest64(url.encode('utf-8'))
+            slot, existing, _ = self.find_slot(key)
+            self.set_slot(slot, key, offset, body_digest, existing is None)
+
+    def scan(self):
+        """(url, body digest, offset) of every complete record, in file order."""
+        self.data.seek(0)
+        offset = 0
+        while True:
+            header = self.data.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            magic, _, url_length, body_length, body_digest, _ = RECORD.unpack(header)
+            url = self.data.read(url_length)
+            if magic != RECORD_MAGIC or len(url) < url_length:
+                return  # torn write at the end
+            yield url.decode('utf-8'), body_digest, offset
+            offset += RECORD.size + url_length + body_length
+            self.data.seek(offset)
+
+    def put(self, url, text):
+        """
+        Store text as the latest version of url; returns False if it was already stored
+        or another process is the writer.
+        """
+        body = text.encode('utf-8')
+        body_digest = digest64(body)
+        key = digest64(url.encode('utf-8'))
+        with self.lock:
+            if not self.take_writer_lock():
+                return False
+            slot, existing, stored_digest = self.find_slot(key)
+            if existing is not None and stored_digest == body_digest:
+                return False
+            if self.compressor:
+                codec, compressed = CODEC_ZSTD, self.compressor.compress(body)
+            else:
+                codec, compressed = CODEC_ZLIB, zlib.compress(body, 6)
+            url_bytes = url.encode('utf-8')
+            self.data.seek(0, os.SEEK_END)
+            offset = self.data.tell()
+            self.data.write(RECORD.pack(RECORD_MAGIC, codec, len(url_bytes), len(compressed), body_digest, time.time()))
+            self.data.write(url_bytes)
+            self.data.write(compressed)
+            # The record is on disk before the index points at it
+            self.data.flush()
+            self.set_slot(slot, key, offset, body_digest, existing is None)
+        return True
+
+    def get(self, url):
+        """The latest archived text of url, or None."""
+        key = digest64(url.encode('utf-8'))
+        with self.lock:
+            self.refresh_index()
+            if not self.index:
+                return None
+            _, offset, _ = self.find_slot(key)
+            if offset is None:
+                return None
+            self.data.seek(offset)
+            header = self.data.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return None
+            magic, codec, url_length, body_length, _, _ = RECORD.unpack(header)
+            stored_url = self.data.read(url_length).decode('utf-8')
+            compressed = self.data.read(body_length)
+        if magic != RECORD_MAGIC or stored_url != url:
+            return None  # 64-bit key collision
+        if codec == CODEC_ZSTD:
+            if zstandard is None:
+                raise ImportError("This archive was written with zstd (pip install zstandard)")
+            body = zstandard.ZstdDecompressor().decompress(compressed)
+        else:
+            body = zlib.decompress(compressed)
+        return body.decode('utf-8')
+
+    def __len__(self):
+        with self.lock:
+            self.refresh_index()
+            return self.used if self.index else 0
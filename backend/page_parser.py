@@ -0,0 +1,409 @@
+import re
+import time
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from bs4.element import CData, NavigableString, Tag
+
+try:
+    import lxml  # noqa: F401  (only needed as a BeautifulSoup tree builder)
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+# Parser backends, fastest first. 'auto' picks the fastest one installed.
+BACKENDS = ['selectolax', 'lxml', 'html.parser']
+
+SUBJECTS = ['國文', '英文', '數學A', '數學B', '社會', '自然', '英聽']
+
+# Labels looked up on a department page. Each pattern is matched (re.search)
+# against every text node and the first hit in document order wins.
+LABEL_PATTERNS = {
+    'code': re.compile(r'校系代碼'),
+    'group': re.compile(r'學群類別'),
+    'quota': re.compile(r'招生名額'),
+    'extra_quota': re.compile(r'外加名額'),
+    'quota_volunteers': re.compile(r'招生名額.*志願數'),
+    'extra_quota_volunteers': re.compile(r'外加名額.*志願數'),
+    'rank_start': re.compile(r'1[\.、]'),
+}
+VOLUNTEER_PATTERN = re.compile(r'可填志願數')
+RANK_LINE_PATTERN = re.compile(r'^(\d+)[\.、](.+)')
+DEPT_TITLE_PATTERN = re.compile(r'\((\d+)\)(.+)')
+
+
+def clean_text(text):
+    if not text:
+        return ""
+    return text.strip().replace('\xa0', '').replace('\r', '').replace('\n', '')
+
+
+class PageIndex:
+    """
+    Flat index of a parsed page, built in one walk over the tree.
+
+    nodes: every string node in document order as (text, td, tr, is_text), where
+           td / tr are the ids of the nearest enclosing cell / row (-1 if none) and
+           is_text tells whether the string counts towards a cell's visible text
+           (comments, scripts etc. are searchable but not part of .text).
+    tds / trs: [start, end, next_sibling_id] ranges into nodes.
+    exact: stripped text -> first node id, for exact label lookups.
+    classes: class name -> [start, end] range of the first element carrying it.
+    """
+
+    def __init__(self):
+        self.nodes = []
+        self.tds = []
+        self.trs = []
+        self.exact = {}
+        self.classes = {}
+
+    def add_string(self, text, td, tr, is_text):
+        self.exact.setdefault(text.strip(), len(self.nodes))
+        self.nodes.append((text, td, tr, is_text))
+
+    def first_matches(self, patterns):
+        # One pass over the text nodes resolving the first hit of every pattern
+        found = {}
+        pending = dict(patterns)
+        for node_id, node in enumerate(self.nodes):
+            if not pending:
+                break
+            for name, pattern in list(pending.items()):
+                if pattern.search(node[0]):
+                    found[name] = node_id
+                    del pending[name]
+        return found
+
+    def find_in_range(self, start, end, pattern):
+        for node_id in range(start, end):
+            if pattern.search(self.nodes[node_id][0]):
+                return node_id
+        return None
+
+    def find_exact_in_range(self, start, end, text):
+        for node_id in range(start, end):
+            if self.nodes[node_id][0].strip() == text:
+                return node_id
+        return None
+
+    def range_text(self, start, end):
+        return ''.join(node[0] for node in self.nodes[start:end] if node[3])
+
+    def range_strings(self, start, end):
+        # Equivalent of Tag.stripped_strings
+        return [node[0].strip() for node in self.nodes[start:end] if node[3] and node[0].strip()]
+
+    def cell_of(self, node_id):
+        return self.nodes[node_id][1] if node_id is not None else -1
+
+    def row_of(self, node_id):
+        return self.nodes[node_id][2] if node_id is not None else -1
+
+    def next_cell(self, td):
+        return self.tds[td][2] if td >= 0 else -1
+
+    def next_row(self, tr):
+        return self.trs[tr][2] if tr >= 0 else -1
+
+    def cell_text(self, td):
+        if td < 0:
+            return ""
+        start, end, _ = self.tds[td]
+        return clean_text(self.range_text(start, end))
+
+    def class_text(self, name):
+        span = self.classes.get(name)
+        return clean_text(self.range_text(*span)) if span else None
+
+
+def available_backends():
+    available = []
+    if LexborHTMLParser is not None:
+        available.append('selectolax')
+    if HAS_LXML:
+        available.append('lxml')
+    available.append('html.parser')
+    return available
+
+
+def resolve_backend(name):
+    """
+    Map a requested backend ('auto', 'selectolax', 'lxml', 'html.parser') to
+    one that is installed, falling back to the next fastest.
+    """
+    available = available_backends()
+    if name in (None, '', 'auto'):
+        return available[0]
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {name}")
+    if name in available:
+        return name
+    # Requested library missing: next fastest installed backend
+    for candidate in BACKENDS[BACKENDS.index(name) + 1:]:
+        if candidate in available:
+            return candidate
+    return 'html.parser'
+
+
+def walk_tree(index, root, children):
+    """
+    Fill index from a tree in one pass. children(node) yields
+    ('string', text, is_text, None) or ('element', node, tag_name, class_names)
+    so the same bookkeeping serves every parser backend.
+    """
+
+    def walk(element, td, tr):
+        last_td = last_tr = -1
+        for kind, child, name, classes in children(element):
+            if kind == 'string':
+                index.add_string(child, td, tr, name)
+                continue
+
+            child_td, child_tr = td, tr
+            if name == 'td':
+                child_td = len(index.tds)
+                index.tds.append([len(index.nodes), 0, -1])
+                if last_td >= 0:
+                    index.tds[last_td][2] = child_td
+                last_td = child_td
+            elif name == 'tr':
+                child_tr = len(index.trs)
+                index.trs.append([len(index.nodes), 0, -1])
+                if last_tr >= 0:
+                    index.trs[last_tr][2] = child_tr
+                last_tr = child_tr
+
+            # Claim class names before descending so the first element in document order wins
+            start = len(index.nodes)
+            claimed = [c for c in classes if c not in index.classes]
+            for c in claimed:
+                index.classes[c] = [start, start]
+
+            walk(child, child_td, child_tr)
+            end = len(index.nodes)
+
+            if child_td != td:
+                index.tds[child_td][1] = end
+            if child_tr != tr:
+                index.trs[child_tr][1] = end
+            for c in claimed:
+                index.classes[c][1] = end
+
+    walk(root, -1, -1)
+    return index
+
+
+def bs4_children(element):
+    for child in element.children:
+        if isinstance(child, NavigableString):
+            yield 'string', str(child), type(child) in (NavigableString, CData), None
+        elif isinstance(child, Tag):
+            yield 'element', child, child.name, child.get('class') or ()
+
+
+# Text inside these is not part of an element's visible text (bs4 Script/Stylesheet strings)
+NON_TEXT_PARENTS = {'script', 'style', 'template'}
+
+
+def selectolax_children(node):
+    is_text = node.tag not in NON_TEXT_PARENTS
+    child = node.child
+    while child is not None:
+        tag = child.tag
+        if tag == '-text':
+            yield 'string', child.text_content or '', is_text, None
+        elif tag == '-comment':
+            yield 'string', child.comment_content or '', False, None
+        elif child.is_element_node:
+            yield 'element', child, tag, (child.attributes.get('class') or '').split()
+        child = child.next
+
+
+def build_index_bs4(soup):
+    return walk_tree(PageIndex(), soup, bs4_children)
+
+
+def build_index_selectolax(tree):
+    return walk_tree(PageIndex(), tree.root, selectolax_children)
+
+
+def parse_tree(html, backend):
+    if backend == 'selectolax':
+        return LexborHTMLParser(html)
+    return BeautifulSoup(html, backend)
+
+
+def select_links(html, selector, backend):
+    """Return (href, text) of every element matching a CSS selector."""
+    tree = parse_tree(html, backend)
+    if backend == 'selectolax':
+        return [(node.attributes.get('href') or '', node.text()) for node in tree.css(selector)]
+    return [(node.get('href') or '', node.text) for node in tree.select(selector)]
+
+
+def parse_universities(html, base_url, backend='html.parser'):
+    # Based on inspection: table tr td a -> href has 'ShowSchGsd.php?colno=XXX'
+    universities = []
+    for href, text in select_links(html, 'table tr td a[href^="ShowSchGsd.php"]', backend):
+        # Extract code from href
+        match = re.search(r'colno=(\w+)', href)
+        universities.append({
+            "name": text.strip(),
+            "code": match.group(1) if match else "Unknown",
+            "url": urljoin(base_url, href)
+        })
+    return universities
+
+
+def parse_department_links(html, uni_url, backend='html.parser'):
+    # Department detail links look like ./html/115_XXXXX.htm
+    departments = []
+    for href, _ in select_links(html, 'a[href*="/html/"]', backend):
+        if "htm" in href:
+            departments.append({"url": urljoin(uni_url, href)})
+    return departments
+
+
+class StageClock:
+    """Records seconds spent per named stage into a dict; a no-op when timings is None."""
+
+    def __init__(self, timings=None):
+        self.timings = timings
+        self.last = time.perf_counter() if timings is not None else 0.0
+
+    def mark(self, stage):
+        if self.timings is not None:
+            now = time.perf_counter()
+            self.timings[stage] = self.timings.get(stage, 0.0) + now - self.last
+            self.last = now
+
+
+def extract_department(index, uni_name, timings=None):
+    """Resolve every department field from a PageIndex. timings, if given, receives seconds per step."""
+    clock = StageClock(timings)
+    data = {}
+    labels = index.first_matches(LABEL_PATTERNS)
+
+    def value_next_to(node_id):
+        # Value sits in the cell right of the label's cell
+        if node_id is None:
+            return ""
+        return index.cell_text(index.next_cell(index.cell_of(node_id)))
+
+    def volunteers_below(node_id):
+        # Structure: <tr><td>招生名額</td><td>4</td></tr> <tr><td>可填志願數</td><td>2</td></tr>
+        next_tr = index.next_row(index.row_of(node_id))
+        if next_tr < 0:
+            return None
+        start, end, _ = index.trs[next_tr]
+        vol_label = index.find_in_range(start, end, VOLUNTEER_PATTERN)
+        if vol_label is None:
+            return None
+        return value_next_to(vol_label)
+
+    # 1. Basic Info
+    school_name = index.class_text('colname')
+    data['學校名稱'] = school_name if school_name is not None else uni_name
+
+    dept_name_text = index.class_text('gsdname') or ""
+    data['校系代碼'] = ""
+    data['學系名稱'] = dept_name_text
+
+    match = DEPT_TITLE_PATTERN.match(dept_name_text)
+    if match:
+        data['校系代碼'] = match.group(1)
+        data['學系名稱'] = match.group(2).strip()
+    elif 'code' in labels:
+        data['校系代碼'] = value_next_to(labels['code'])
+    clock.mark('extract_basic')
+
+    # 2. Table Data
+    data['學群類別'] = value_next_to(labels.get('group'))
+
+    if 'quota' in labels:
+        data['招生名額'] = value_next_to(labels['quota'])
+        volunteers = volunteers_below(labels['quota'])
+        if volunteers is not None:
+            data['招生名額各學群可選填志願數'] = volunteers
+
+    if 'extra_quota' in labels:
+        data['外加名額'] = value_next_to(labels['extra_quota'])
+        volunteers = volunteers_below(labels['extra_quota'])
+        if volunteers is not None:
+            data['外加名額各學群可選填志願數'] = volunteers
+
+    # Fallback for volunteers if not found by strict structure (some pages use full labels)
+    if not data.get('招生名額各學群可選填志願數'):
+        data['招生名額各學群可選填志願數'] = value_next_to(labels.get('quota_volunteers'))
+    if not data.get('外加名額各學群可選填志願數'):
+        data['外加名額各學群可選填志願數'] = value_next_to(labels.get('extra_quota_volunteers'))
+    clock.mark('extract_table')
+
+    # 3. Test Standards (檢定標準)
+    standards = {subject: '' for subject in SUBJECTS}
+
+    # Case B: one cell lists all subjects (br separated), the next cell all values.
+    # Exact matches avoid hitting "國語文..." in rank items.
+    found_multi_mode = False
+    first_subj = index.exact.get('國文')
+    subj_td = index.cell_of(first_subj)
+    if subj_td >= 0:
+        start, end, next_td = index.tds[subj_td]
+        if index.find_exact_in_range(start, end, '英文') is not None:
+            found_multi_mode = True
+            subjects_in_order = [s for s in index.range_strings(start, end) if s in standards]
+            if next_td >= 0:
+                values_in_order = index.range_strings(*index.tds[next_td][:2])
+                for i, subj in enumerate(subjects_in_order):
+                    if i < len(values_in_order):
+                        standards[subj] = values_in_order[i]
+
+    if not found_multi_mode:
+        # Case A: Standard table (one subject per cell header)
+        for subject in SUBJECTS:
+            standards[subject] = value_next_to(index.exact.get(subject))
+    clock.mark('extract_standards')
+
+    # 4. Ranking Items (分發比序項目)
+    rank_items = {f'分發比序項目{i}': "" for i in range(1, 9)}
+    rank_td = index.cell_of(labels.get('rank_start'))
+    if rank_td >= 0:
+        start, end, _ = index.tds[rank_td]
+        for line in index.range_strings(start, end):
+            m = RANK_LINE_PATTERN.match(line)
+            if m:
+                idx = int(m.group(1))
+                if 1 <= idx <= 8:
+                    rank_items[f'分發比序項目{idx}'] = m.group(2).strip()
+
+    data.update(standards)
+    data.update(rank_items)
+    clock.mark('extract_ranking')
+    return data
+
+
+def parse_department(html, uni_name, backend='html.parser', timings=None):
+    clock = StageClock(timings)
+    tree = parse_tree(html, backend)
+    clock.mark('tree')
+    if backend == 'selectolax':
+        index = build_index_selectolax(tree)
+    else:
+        index = build_index_bs4(tree)
+    clock.mark('index')
+    return extract_department(index, uni_name, timings)
+
+
+def parse_department_job(body, uni_name, backend):
+    """Process pool entry point: raw page bytes in, (details, error message, stage timings) out."""
+    timings = {}
+    try:
+        return parse_department(body.decode('utf-8'), uni_name, backend, timings), None, timings
+    except Exception as e:
+        return None, str(e), timings
@@ -0,0 +1,164 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+
+class TokenBucket:
+    """Simple thread-safe token bucket. rate is tokens (requests) per second."""
+
+    def __init__(self, rate, burst=1):
+        self.rate = float(rate)
+        self.capacity = max(float(burst), 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        # Take one token and return how long the caller has to wait for it.
+        # Tokens may go negative, which queues up later callers fairly.
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0.0
+            return -self.tokens / self.rate
+
+
+class RateLimiter:
+    """
+    Global + per-host request rate limiter shared by all fetch workers.
+    A limit of None (or 0) disables that bucket.
+    """
+
+    def __init__(self, global_rps=None, per_host_rps=None, burst=1):
+        self.global_bucket = TokenBucket(global_rps, burst) if global_rps else None
+        self.per_host_rps = per_host_rps
+        self.burst = burst
+        self.host_buckets = {}
+        self.lock = threading.Lock()
+
+    def _host_bucket(self, host):
+        with self.lock:
+            bucket = self.host_buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.per_host_rps, self.burst)
+                self.host_buckets[host] = bucket
+            return bucket
+
+    def on_success(self, url, latency):
+        # Fixed limits ignore feedback; AdaptiveRateLimiter overrides these
+        pass
+
+    def on_busy(self, url, retry_after=None):
+        pass
+
+    def wait(self, url, should_stop=None):
+        delays = []
+        if self.global_bucket:
+            delays.append(self.global_bucket.reserve())
+        if self.per_host_rps:
+            delays.append(self._host_bucket(urlparse(url).netloc).reserve())
+
+        delay = max(delays) if delays else 0.0
+        return sleep_until(time.monotonic() + delay, should_stop)
+
+
+def sleep_until(deadline, should_stop=None):
+    # Sleep in small slices so a stop request is honoured quickly; False if stopped
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return True
+        if should_stop and should_stop():
+            return False
+        time.sleep(min(remaining, 0.2))
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Exponential backoff with full jitter: uniform(0, min(cap, base * 2**attempt))."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class AdaptiveRateLimiter(RateLimiter):
+    """
+    Per-host rate found by AIMD instead of a fixed number.
+
+    Every fast successful response raises the host's rate additively (about
+    increase_step requests/second per second of healthy traffic); a busy page,
+    a 429/503, a timeout or a slow response cuts it multiplicatively. A
+    Retry-After from the server pauses every worker hitting that host.
+    global_rps is still a fixed upper bound across all hosts.
+    """
+
+    def __init__(self, global_rps=None, initial_rps=1.0, min_rps=0.2, max_rps=8.0,
+                 increase_step=0.5, decrease_factor=0.5, slow_latency=3.0, burst=1):
+        super().__init__(global_rps, None, burst)
+        self.initial_rps = initial_rps
+        self.min_rps = min_rps
+        self.max_rps = max_rps
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.slow_latency = slow_latency
+        self.paused_until = {}
+
+    def _host_bucket(self, host):
+        with self.lock:
+            bucket = self.host_buckets.get(host)
+            if bucket is None:
+                bucket = TokenBucket(self.initial_rps, self.burst)
+                self.host_buckets[host] = bucket
+            return bucket
+
+    def _set_rate(self, url, rate_fn):
+        bucket = self._host_bucket(urlparse(url).netloc)
+        with bucket.lock:
+            bucket.rate = min(self.max_rps, max(self.min_rps, rate_fn(bucket.rate)))
+
+    def on_success(self, url, latency):
+        if latency > self.slow_latency:
+            # The server is struggling before it starts refusing; ease off gently
+            self._set_rate(url, lambda rate: rate * 0.8)
+        else:
+            self._set_rate(url, lambda rate: rate + self.increase_step / rate)
+
+    def on_busy(self, url, retry_after=None):
+        self._set_rate(url, lambda rate: rate * self.decrease_factor)
+        if retry_after:
+            host = urlparse(url).netloc
+            with self.lock:
+                until = time.monotonic() + retry_after
+                self.paused_until[host] = max(until, self.paused_until.get(host, 0.0))
+
+    def rates(self):
+        """Current requests/second per host."""
+        with self.lock:
+            return {host: bucket.rate for host, bucket in self.host_buckets.items()}
+
+    def wait(self, url, should_stop=None):
+        host = urlparse(url).netloc
+        with self.lock:
+            paused_until = self.paused_until.get(host, 0.0)
+        delays = [paused_until - time.monotonic(), self._host_bucket(host).reserve()]
+        if self.global_bucket:
+            delays.append(self.global_bucket.reserve())
+        return sleep_until(time.monotonic() + max(delays), should_stop)
@@ -0,0 +1,160 @@
+import collections
+import os
+import threading
+
+from columnar import QUOTA_COLUMNS, RANK_COLUMNS, VOLUNTEER_COLUMNS, parse_count, standard_levels
+from page_parser import SUBJECTS
+from sinks import read_rows
+
+STANDARD_COLUMNS = [f'{subject}檢定標準' for subject in SUBJECTS]
+# Columns with an inverted index (value -> row ids); filters on them never scan the rows
+INDEXED_COLUMNS = ['學群類別', '學校名稱'] + STANDARD_COLUMNS
+NUMERIC_COLUMNS = QUOTA_COLUMNS + VOLUNTEER_COLUMNS
+
+
+class ResultIndex:
+    """
+    Read-only, indexed view of one job's result rows for filter / search / sort / paginate.
+
+    Exact-match filters use inverted indexes on INDEXED_COLUMNS. Text search over the
+    分發比序項目 columns uses a character bigram index (Chinese has no word breaks), and
+    candidates are confirmed with a substring check. Sort orders are built once per column.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.postings = {column: collections.defaultdict(set) for column in INDEXED_COLUMNS}
+        self.texts = []
+        self.grams = collections.defaultdict(set)
+        for row_id, row in enumerate(rows):
+            for column in INDEXED_COLUMNS:
+                self.postings[column][row.get(column) or ''].add(row_id)
+            text = '\n'.join(row.get(column) or '' for column in RANK_COLUMNS).lower()
+            self.texts.append(text)
+            for gram in self.text_grams(text):
+                self.grams[gram].add(row_id)
+        self.ranks = {}
+        self.derived_values = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def text_grams(text):
+        # Single characters (for one-character queries) and character bigrams
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        grams.discard('\n')
+        return grams
+
+    def derived(self, name, build):
+        """build(rows) computed once and cached with this index (e.g. an eligibility matrix)."""
+        with self.lock:
+            if name not in self.derived_values:
+                self.derived_values[name] = build(self.rows)
+            return self.derived_values[name]
+
+    def values(self, column):
+        """Distinct values of an indexed column with their row counts."""
+        return {value: len(ids) for value, ids in self.postings[column].items()}
+
+    def search(self, term):
+        """Row ids whose 分發比序項目 contain term."""
+        term = term.lower()
+        grams = [term] if len(term) == 1 else [term[i:i + 2] for i in range(len(term) - 1)]
+        # Smallest posting list first keeps the intersection cheap
+        postings = sorted((self.grams.get(gram, set()) for gram in grams), key=len)
+        candidates = set(postings[0]).intersection(*postings[1:])
+        return {row_id for row_id in candidates if term in self.texts[row_id]}
+
+    def rank(self, column):
+        """(position of every row sorted by column, set of rows where it is blank)."""
+        with self.lock:
+            cached = self.ranks.get(column)
+        if cached is not None:
+            return cached
+
+        def key(row_id):
+            value = self.rows[row_id].get(column) or ''
+            if column in NUMERIC_COLUMNS:
+                number = parse_count(value)
+                return (number is None, number or 0, '')
+            if column in STANDARD_COLUMNS:
+                # Levels are listed highest first; ascending runs from the lowest level up
+                levels = standard_levels(column[:-len('檢定標準')])
+                return (value not in levels, -levels.index(value) if value in levels else 0, '')
+            return (not value, 0, value)
+
+        ranks, blanks = [0] * len(self.rows), set()
+        for position, row_id in enumerate(sorted(range(len(self.rows)), key=key)):
+            ranks[row_id] = position
+            if key(row_id)[0]:
+                blanks.add(row_id)
+        # Concurrent first queries may each build it; every copy is the same
+        with self.lock:
+            self.ranks[column] = (ranks, blanks)
+        return ranks, blanks
+
+    def query(self, filters=None, text=None, sort=None, descending=False, page=1, per_page=50):
+        """
+        :param filters: {column: [values]} on INDEXED_COLUMNS; values of one column are OR-ed,
+                        columns are AND-ed.
+        :param text: Whitespace-separated terms that must all appear in the 分發比序項目 columns.
+        :param sort: Column to sort by (department order if None).
+        Returns {'total', 'page', 'per_page', 'rows'}.
+        """
+        matches = None
+        for column, values in (filters or {}).items():
+            if column not in self.postings:
+                raise ValueError(f"Column is not indexed: {column}")
+            ids = set().union(*(self.postings[column].get(value, set()) for value in values))
+            matches = ids if matches is None else matches & ids
+        for term in (text or '').split():
+            ids = self.search(term)
+            matches = ids if matches is None else matches & ids
+
+        ids = range(len(self.rows)) if matches is None else matches
+        if sort:
+            if self.rows and sort not in self.rows[0]:
+                raise ValueError(f"Unknown sort column: {sort}")
+            ranks, blanks = self.rank(sort)
+            # Blank values stay last in both directions
+            sign = -1 if descending else 1
+            ordered = sorted(ids, key=lambda row_id: (row_id in blanks, sign * ranks[row_id]))
+        else:
+            ordered = sorted(ids, reverse=descending)
+
+        start = (page - 1) * per_page
+        return {
+            'total': len(ordered),
+            'page': page,
+            'per_page': per_page,
+            'rows': [self.rows[row_id] for row_id in ordered[start:start + per_page]],
+        }
+
+
+class ResultIndexCache:
+    """
+    Indexes of the most recently queried result files, keyed by path and modification
+    time so a rewritten output (e.g. after /api/retry) is indexed again.
+    """
+
+    def __init__(self, max_entries=8):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = collections.OrderedDict()
+
+    def get(self, path):
+        key = (path, os.path.getmtime(path))
+        with self.lock:
+            index = self.entries.get(key)
+            if index is not None:
+                self.entries.move_to_end(key)
+                return index
+
+        index = ResultIndex(read_rows(path))
+        with self.lock:
+            for old_key in [k for k in self.entries if k[0] == path]:
+                del self.entries[old_key]
+            self.entries[key] = index
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return index
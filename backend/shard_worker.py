@@ -0,0 +1,169 @@
+import argparse
+import os
+import socket
+import threading
+import uuid
+
+from metrics import JobMetrics
+from rate_limit import AdaptiveRateLimiter
+from star_scraper import StarPlanScraper
+from transport import make_transport
+from work_queue import UNIVERSITY_POSITION, WorkQueue
+
+# Run on every machine that should take part in a sharded crawl:
+#
+#   python backend/shard_worker.py --queue /shared/star_work.sqlite --threads 8
+#
+# The coordinator (/api/start with "sharded": true) queues the universities and merges the rows.
+
+
+class ShardWorker:
+    """
+    Pulls work items from a WorkQueue on `threads` threads: scans leased universities
+    (queueing their departments) and fetches + parses leased departments. Leases are
+    renewed by a heartbeat thread, so a dead worker's items go back to the queue.
+    """
+
+    def __init__(self, work_queue, worker_id=None, threads=4, lease_seconds=60.0, idle_wait=2.0,
+                 **scraper_options):
+        self.work_queue = work_queue
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.threads = max(1, int(threads))
+        self.lease_seconds = lease_seconds
+        self.idle_wait = idle_wait
+        # Connections and the per-host rate are shared by every item this worker handles
+        if not scraper_options.get('transport'):
+            scraper_options['transport'] = make_transport(pool_size=max(10, self.threads))
+        if not scraper_options.get('rate_limiter'):
+            scraper_options['rate_limiter'] = AdaptiveRateLimiter(None)
+        if not scraper_options.get('metrics'):
+            scraper_options['metrics'] = JobMetrics()
+        self.scraper_options = scraper_options
+        self.held = {}
+        self.scrapers = set()  # in flight, so stop() reaches them
+        self.held_lock = threading.Lock()
+        self.stopped = threading.Event()
+
+    def scraper(self, item):
+        # One short-lived scraper per item: its failure ledger then describes only that item
+        scraper = StarPlanScraper(item['base_url'], **self.scraper_options)
+        with self.held_lock:
+            scraper.should_stop = self.stopped.is_set()
+            self.scrapers.add(scraper)
+        return scraper
+
+    def process(self, item):
+        scraper = self.scraper(item)
+        try:
+            self.process_with(scraper, item)
+        finally:
+            with self.held_lock:
+                self.scrapers.discard(scraper)
+
+    def process_with(self, scraper, item):
+        if item['position'] == UNIVERSITY_POSITION:
+            uni = item['payload']
+            depts = scraper.get_departments(uni['url'], uni['name'])
+            if scraper.failures:
+                self.work_queue.fail(self.worker_id, item, self.failure(scraper))
+                return
+            if not depts and scraper.should_stop:
+                # Stopped before its page was read; an empty list here would lose its departments
+                self.work_queue.release(self.worker_id, item)
+                return
+            for dept in depts:
+                dept['uni_name'] = uni['name']
+                dept['uni_url'] = uni['url']
+            self.work_queue.complete_university(self.worker_id, item, depts)
+            return
+
+        dept = item['payload']
+        html = scraper.fetch_department(dept)
+        result = scraper.extract_row(dept, html) if html else None
+        if result:
+            self.work_queue.complete_department(self.worker_id, item, result[0])
+        elif scraper.failures:
+            failure = self.failure(scraper)
+            # Parsing the same page again fails the same way
+            self.work_queue.fail(self.worker_id, item, failure, retry=failure['stage'] != 'parse')
+        elif html:
+            self.work_queue.fail(self.worker_id, item, {'stage': 'parse', 'reason': 'no details found'}, retry=False)
+        else:
+            # Stopped mid-fetch
+            self.work_queue.release(self.worker_id, item)
+
+    def failure(self, scraper):
+        entry = scraper.failures[0]
+        return {'stage': entry['stage'], 'reason': entry['reason'], 'seconds': entry['seconds']}
+
+    def work(self):
+        while not self.stopped.is_set():
+            item = self.work_queue.lease(self.worker_id, self.lease_seconds)
+            if item is None:
+                self.stopped.wait(self.idle_wait)
+                continue
+            key = (item['crawl_id'], item['group'], item['position'])
+            with self.held_lock:
+                self.held[key] = item
+            try:
+                self.process(item)
+            except Exception as e:
+                self.work_queue.fail(self.worker_id, item, {'stage': 'worker', 'reason': str(e)})
+            finally:
+                with self.held_lock:
+                    self.held.pop(key, None)
+
+    def heartbeat(self):
+        while not self.stopped.wait(self.lease_seconds / 3):
+            with self.held_lock:
+                items = list(self.held.values())
+            if items:
+                self.work_queue.heartbeat(self.worker_id, items, self.lease_seconds)
+
+    def start(self):
+        """Run in background threads; returns them."""
+        threads = [threading.Thread(target=self.heartbeat, daemon=True)]
+        threads += [threading.Thread(target=self.work, daemon=True) for _ in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def stop(self):
+        with self.held_lock:
+            self.stopped.set()
+            for scraper in self.scrapers:
+                scraper.should_stop = True
+
+    def run(self):
+        """Work until interrupted (Ctrl+C)."""
+        threads = self.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            self.stop()
+            for thread in threads:
+                thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker of a sharded crawl")
+    parser.add_argument('--queue', required=True, help="shared work queue sqlite file")
+    parser.add_argument('--threads', type=int, default=4, help="items processed concurrently")
+    parser.add_argument('--lease', type=float, default=60.0, help="lease length in seconds")
+    parser.add_argument('--per-host-rps', type=float, default=None, help="max requests per second per host")
+    parser.add_argument('--parser', default='auto', help="html.parser / lxml / selectolax / auto")
+    args = parser.parse_args()
+
+    worker = ShardWorker(
+        WorkQueue(args.queue), threads=args.threads, lease_seconds=args.lease,
+        rate_limiter=AdaptiveRateLimiter(None, max_rps=args.per_host_rps or 8.0),
+        parser_backend=args.parser,
+    )
+    print(f"Worker {worker.worker_id} pulling from {args.queue}")
+    worker.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import csv
+import json
+import os
+
+from openpyxl import Workbook
+
+
+class RowSink:
+    """
+    Receives result rows one at a time as the scraper produces them.
+    Subclasses implement write(row) and close(); close() finalizes the output.
+    """
+
+    def write(self, row):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvSink(RowSink):
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+        # utf-8-sig so Excel opens the Chinese headers correctly
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = None
+
+    def write(self, row):
+        if self.writer is None:
+            self.columns = self.columns or list(row.keys())
+            self.writer = csv.DictWriter(self.file, fieldnames=self.columns, extrasaction='ignore')
+            self.writer.writeheader()
+        self.writer.writerow(row)
+        # Rows written so far survive a crash
+        self.file.flush()
+
+    def close(self):
+        if self.writer is None and self.columns:
+            csv.writer(self.file).writerow(self.columns)
+        self.file.close()
+
+
+class JsonLinesSink(RowSink):
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'w', encoding='utf-8')
+
+    def write(self, row):
+        self.file.write(json.dumps(row, ensure_ascii=False) + '\n')
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class XlsxSink(RowSink):
+    """xlsx writer using openpyxl's write-only mode, which streams rows instead of keeping cells in memory."""
+
+    def __init__(self, path, columns=None):
+        self.path = path
+        self.columns = columns
+        self.workbook = Workbook(write_only=True)
+        self.sheet = self.workbook.create_sheet()
+        self.header_written = False
+
+    def _write_header(self):
+        self.sheet.append(self.columns)
+        self.header_written = True
+
+    def write(self, row):
+        if not self.header_written:
+            self.columns = self.columns or list(row.keys())
+            self._write_header()
+        self.sheet.append([row.get(column, '') for column in self.columns])
+
+    def close(self):
+        if not self.header_written and self.columns:
+            self._write_header()
+        self.workbook.save(self.path)
+
+
+class PreviewSink(RowSink):
+    """Keeps only the first `limit` rows, for UI previews."""
+
+    def __init__(self, limit=10):
+        self.limit = limit
+        self.rows = []
+
+    def write(self, row):
+        if len(self.rows) < self.limit:
+            self.rows.append(row)
+
+
+class MultiSink(RowSink):
+    def __init__(self, *sinks):
+        self.sinks = sinks
+
+    def write(self, row):
+        for sink in self.sinks:
+            sink.write(row)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+SINKS_BY_EXTENSION = {
+    '.csv': CsvSink,
+    '.jsonl': JsonLinesSink,
+    '.xlsx': XlsxSink,
+}
+
+
+def open_sink(path, columns=None):
+    """Pick a sink from the file extension (.csv, .jsonl, .xlsx, .parquet or .arrow)."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.arrow'):
+        # Typed columnar output (needs pyarrow)
+        from columnar import ArrowSink, ParquetSink
+        return ParquetSink(path) if extension == '.parquet' else ArrowSink(path)
+    if extension not in SINKS_BY_EXTENSION:
+        raise ValueError(f"Unsupported output format: {extension}")
+    if extension == '.jsonl':
+        return JsonLinesSink(path)
+    return SINKS_BY_EXTENSION[extension](path, columns)
+
+
+def read_rows(path):
+    """Read the rows of an output file written by one of the sinks above, as string dicts."""
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.parquet', '.arrow'):
+        from columnar import read_rows as read_columnar_rows
+        return read_columnar_rows(path)
+    if extension == '.csv':
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            return list(csv.DictReader(f))
+    if extension == '.jsonl':
+        with open(path, encoding='utf-8') as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if extension == '.xlsx':
+        from openpyxl import load_workbook
+        workbook = load_workbook(path, read_only=True)
+        try:
+            values = workbook.active.iter_rows(values_only=True)
+            header = next(values, None) or []
+            return [{column: '' if value is None else str(value) for column, value in zip(header, row)}
+                    for row in values]
+        finally:
+            workbook.close()
+    raise ValueError(f"Unsupported output format: {extension}")
@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+
+import numpy as np
+
+from columnar import QUOTA_COLUMNS, VOLUNTEER_COLUMNS, ParquetSink, pq, require_pyarrow
+from result_index import STANDARD_COLUMNS
+
+DATE_PATTERN = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+KEY_COLUMN = '校系代碼'
+LABEL_COLUMNS = ['學校名稱', '學系名稱']
+COUNT_COLUMNS = QUOTA_COLUMNS + VOLUNTEER_COLUMNS
+
+
+class SnapshotStore:
+    """
+    Results of full crawls, one typed Parquet file per crawl date (YYYY-MM-DD.parquet,
+    same schema as the Parquet export). A later crawl on the same date replaces it.
+    """
+
+    def __init__(self, directory):
+        require_pyarrow()
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, date):
+        if not DATE_PATTERN.match(date or ''):
+            raise ValueError(f"Snapshot dates look like 2026-10-17, got {date!r}")
+        return os.path.join(self.directory, f'{date}.parquet')
+
+    def save(self, date, rows):
+        path = self.path(date)
+        # Written aside and renamed so readers never see a half-written snapshot
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with ParquetSink(temp_path) as sink:
+            for row in rows:
+                sink.write(row)
+        os.replace(temp_path, path)
+        return path
+
+    def dates(self):
+        return sorted(name[:-len('.parquet')] for name in os.listdir(self.directory)
+                      if name.endswith('.parquet') and DATE_PATTERN.match(name[:-len('.parquet')]))
+
+    def list(self):
+        return [{'date': date, 'rows': pq.ParquetFile(self.path(date)).metadata.num_rows}
+                for date in self.dates()]
+
+    def load(self, date):
+        """The snapshot as a DataFrame indexed by 校系代碼 (rows without a code are dropped)."""
+        path = self.path(date)
+        if not os.path.exists(path):
+            raise KeyError(date)
+        columns = [KEY_COLUMN] + LABEL_COLUMNS + COUNT_COLUMNS + STANDARD_COLUMNS
+        frame = pq.read_table(path, columns=columns).to_pandas()
+        frame = frame[frame[KEY_COLUMN].fillna('') != '']
+        frame = frame.drop_duplicates(KEY_COLUMN).set_index(KEY_COLUMN)
+        frame[COUNT_COLUMNS] = frame[COUNT_COLUMNS].astype('Int64')
+        # Dictionary-encoded levels come back as categoricals; compare them as plain strings
+        frame[STANDARD_COLUMNS] = frame[STANDARD_COLUMNS].astype(object).fillna('')
+        return frame
+
+    def diff(self, old_date, new_date):
+        return diff_snapshots(self.load(old_date), self.load(new_date))
+
+
+def plain(value, missing):
+    """JSON-friendly cell value; the fill value of missing cells becomes None."""
+    if value == missing:
+        return None
+    return value.item() if hasattr(value, 'item') else value
+
+
+def diff_snapshots(old, new):
+    """
+    Compare two snapshots (see SnapshotStore.load) with one outer join on 校系代碼.
+    Returns added / removed departments and quota / standard changes, each change as
+    {校系代碼, 學校名稱, 學系名稱, column, from, to}.
+    """
+    joined = old.join(new, how='outer', lsuffix='_old', rsuffix='_new')
+    in_old = joined[f'{LABEL_COLUMNS[0]}_old'].notna()
+    in_new = joined[f'{LABEL_COLUMNS[0]}_new'].notna()
+
+    def departments(mask, side):
+        frame = joined.loc[mask, [f'{column}_{side}' for column in LABEL_COLUMNS]]
+        frame.columns = LABEL_COLUMNS
+        return frame.reset_index().to_dict('records')
+
+    both = joined[in_old & in_new]
+    labels = both[[f'{column}_new' for column in LABEL_COLUMNS]].set_axis(LABEL_COLUMNS, axis=1)
+
+    def changes(columns, missing):
+        # One (code, column) entry per changed cell, found in a single array comparison
+        old_values = both[[f'{column}_old' for column in columns]].fillna(missing).to_numpy(object)
+        new_values = both[[f'{column}_new' for column in columns]].fillna(missing).to_numpy(object)
+        rows, cols = np.nonzero(old_values != new_values)
+        frame = labels.iloc[rows].reset_index()
+        frame['column'] = [columns[col] for col in cols]
+        frame['from'] = [plain(value, missing) for value in old_values[rows, cols]]
+        frame['to'] = [plain(value, missing) for value in new_values[rows, cols]]
+        return frame.to_dict('records')
+
+    added, removed = departments(in_new & ~in_old, 'new'), departments(in_old & ~in_new, 'old')
+    quota_changes = changes(COUNT_COLUMNS, -1)
+    standard_changes = changes(STANDARD_COLUMNS, '')
+    return {
+        'summary': {
+            'added': len(added),
+            'removed': len(removed),
+            'quota_changes': len(quota_changes),
+            'standard_changes': len(standard_changes),
+        },
+        'added': added,
+        'removed': removed,
+        'quota_changes': quota_changes,
+        'standard_changes': standard_changes,
+    }
@@ -1,420 +1,825 @@
-import requests
-from bs4 import BeautifulSoup
 import pandas as pd
+import collections
 import time
 import os
-import re
-from urllib.parse import urljoin
+import threading
+import queue
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
 
 import random
 
+from transport import TransportError, make_transport
+from rate_limit import AdaptiveRateLimiter, RateLimiter, backoff_delay, parse_retry_after, sleep_until
+from incremental import content_hash
+from metrics import JobMetrics
+from page_parser import (clean_text, parse_department, parse_department_job, parse_department_links,
+                         parse_universities, resolve_backend)
+
+# Bump when the extraction logic changes so incremental crawls re-parse every page
+PARSER_VERSION = 1
+
+# Column order of the exported sheet
+COLUMNS = [
+    '學校名稱', '學系名稱', '校系代碼', '學群類別', '招生名額', '外加名額',
+    '招生名額各學群可選填志願數', '外加名額各學群可選填志願數',
+    '國文檢定標準', '英文檢定標準', '數學A檢定標準', '數學B檢定標準',
+    '社會檢定標準', '自然檢定標準', '英聽檢定標準',
+    '分發比序項目1', '分發比序項目2', '分發比序項目3', '分發比序項目4',
+    '分發比序項目5', '分發比序項目6', '分發比序項目7', '分發比序項目8',
+    '資料連結',
+]
+
+class DepartmentOrder:
+    """
+    Output positions of departments whose universities are scanned out of order.
+    Group g's departments follow those of every earlier group, so their positions are
+    known once all earlier groups are added; rows finished before that are held here.
+    """
+
+    def __init__(self, group_count):
+        self.groups = [None] * group_count
+        self.offsets = {}
+        self.placed = 0   # groups 0..placed-1 have an offset
+        self.size = 0     # departments in those groups
+        self.found = 0    # departments in every added group
+        self.held = {}    # group -> [(position, row)]
+
+    def add(self, group, departments):
+        """Add a group's departments; returns [(index, dept, row)] of held rows placed by it."""
+        self.groups[group] = departments
+        self.found += len(departments)
+        placed = []
+        while self.placed < len(self.groups) and self.groups[self.placed] is not None:
+            current = self.placed
+            self.offsets[current] = self.size
+            self.size += len(self.groups[current])
+            self.placed += 1
+            for position, row in self.held.pop(current, []):
+                placed.append((self.offsets[current] + position, self.groups[current][position], row))
+        return placed
+
+    def place(self, group, position, row):
+        """[(index, dept, row)] for a finished row, or [] while its position is not known yet."""
+        if group in self.offsets:
+            return [(self.offsets[group] + position, self.groups[group][position], row)]
+        self.held.setdefault(group, []).append((position, row))
+        return []
+
+    def held_rows(self):
+        """Rows still waiting for an earlier group, in department order."""
+        return [row for group in sorted(self.held) for _, row in sorted(self.held[group], key=lambda item: item[0])]
+
+    def departments(self, placed_only=False):
+        """The flat department list of every added group (or of the placed ones)."""
+        groups = self.groups[:self.placed] if placed_only else self.groups
+        return [dept for group in groups if group for dept in group]
+
+
 class StarPlanScraper:
-    def __init__(self, base_url, progress_callback=None):
+    def __init__(self, base_url, progress_callback=None, max_workers=1,
+                 requests_per_second=None, per_host_rps=None, cache=None, offline=False,
+                 department_store=None, parser_backend='html.parser', parse_workers=0,
+                 parse_queue_size=64, sink=None, keep_results=True, checkpoint=None,
+                 fetch_coordinator=None, adaptive_rate=True, rate_limiter=None, transport=None,
+                 metrics=None, log_callback=None, archive=None):
+        """
+        :param max_workers: Number of pages fetched concurrently. 1 keeps the original serial crawl.
+        :param requests_per_second: Global request rate limit shared by all workers (None = unlimited).
+        :param per_host_rps: Request rate limit per host (None = unlimited). With adaptive_rate this is
+                             the ceiling the adaptive rate may climb to.
+        :param cache: Optional HttpCache used to skip or revalidate unchanged pages.
+        :param offline: Replay the crawl from the cache only, never touching the network.
+        :param department_store: Optional DepartmentStore; unchanged department pages reuse their stored row.
+        :param parser_backend: 'html.parser', 'lxml', 'selectolax' or 'auto' (fastest installed).
+                               Falls back to the next fastest backend when the library is missing.
+        :param parse_workers: Parse department pages in this many worker processes, fed by the
+                              fetch threads through a bounded queue. 0 parses inline in the fetch threads.
+        :param parse_queue_size: Max fetched pages waiting for (or in) the parse stage.
+        :param sink: Optional RowSink receiving every row as soon as it is produced (in department order).
+        :param keep_results: Also collect rows in self.results. Turn off with a sink to keep memory flat.
+        :param checkpoint: Optional JobCheckpoint; the department list and finished rows are saved
+                           periodically so run(resume=True) can continue after an interruption.
+        :param fetch_coordinator: Optional SingleFlight shared between scrapers; concurrent fetches of
+                                  the same URL by different jobs are coalesced into one request.
+        :param adaptive_rate: Let the per-host rate follow the server (AIMD on latency and busy
+                              responses) instead of fixed limits and random pauses.
+        :param rate_limiter: Optional limiter shared between scrapers; overrides the three options above.
+        :param transport: Optional transport (see transport.make_transport) shared between scrapers.
+                          By default a requests pool sized for max_workers is created.
+        :param metrics: Optional JobMetrics receiving fetch/parse timings and counters
+                        (a private one is created otherwise, see self.metrics.summary()).
+        :param log_callback: Called with every log message (besides printing it).
+        :param archive: Optional PageArchive. Every fetched page is archived; with offline the
+                        crawl is replayed from the archive (then the cache) without the network.
+        """
         self.base_url = base_url
         self.progress_callback = progress_callback
-        self.session = requests.Session()
-        self.session.headers.update({
-            "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
-            "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7"
-        })
+        self.max_workers = max(1, int(max_workers or 1))
+        self.rate_limiter = rate_limiter
+        if rate_limiter is None:
+            if adaptive_rate:
+                self.rate_limiter = AdaptiveRateLimiter(requests_per_second, max_rps=per_host_rps or 8.0)
+            elif requests_per_second or per_host_rps:
+                self.rate_limiter = RateLimiter(requests_per_second, per_host_rps)
+        self.progress_lock = threading.Lock()
+        self.cache = cache
+        self.offline = offline
+        self.department_store = department_store
+        self.parse_workers = max(0, int(parse_workers or 0))
+        self.parse_queue_size = max(1, int(parse_queue_size))
+        self.parser_backend = resolve_backend(parser_backend)
+        if parser_backend not in (None, '', 'auto') and self.parser_backend != parser_backend:
+            self.log(f"Parser backend '{parser_backend}' is not installed, using '{self.parser_backend}'.")
+        # new / changed / unchanged / removed department counts of the last run
+        self.change_stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+        # One pooled, keep-alive client for all fetch workers (headers are passed per request)
+        self.transport = transport or make_transport(pool_size=max(10, self.max_workers))
         self.universities = []
         self.departments = []
         self.results = []
+        self.sink = sink
+        self.keep_results = keep_results
+        self.checkpoint = checkpoint
+        self.fetch_coordinator = fetch_coordinator
+        self.row_count = 0
+        self.metrics = metrics or JobMetrics()
+        # Every URL given up on during the last run: url, stage, reason, attempts, seconds, ...
+        self.failures = []
+        # (scanned, total) universities of the running crawl
+        self.scan_progress = (0, 0)
+        self.log_callback = log_callback
+        self.archive = archive
         self.should_stop = False
 
     def log(self, message):
         print(message)
-        if self.progress_callback:
-            # We can use a special status for logs if needed, but for now just pass it
-            pass
+        if self.log_callback:
+            self.log_callback(message)
 
-    def fetch_page(self, url, retries=5, referer=None):
+    def fetch_page(self, url, retries=5, referer=None, failure=None):
+        """
+        Returns the page text, or None. When the fetch was given up (not merely
+        stopped), the optional failure dict receives 'reason' and 'attempts'.
+        """
         if self.should_stop:
             return None
-            
-        # Update headers with referer if provided
-        if referer:
-            self.session.headers.update({'Referer': referer})
+        if self.offline and self.archive is not None:
+            text = self.archive.get(url)
+            if text is not None:
+                self.metrics.inc('fetch_requests_total', outcome='archive')
+                return text
+        text = self.fetch_page_shared(url, retries, referer, failure)
+        if text and self.archive is not None and not self.offline:
+            self.archive.put(url, text)
+        return text
+
+    def fetch_page_shared(self, url, retries=5, referer=None, failure=None):
+        if not self.fetch_coordinator:
+            return self.fetch_page_direct(url, retries, referer, failure)
+
+        # Other jobs fetching the same URL right now share one request
+        def fetch():
+            leader_failure = {}
+            text = self.fetch_page_direct(url, retries, referer, leader_failure)
+            # Tell waiters whether None only means "this job was stopped"
+            return text, text is None and self.should_stop, leader_failure
+
+        while True:
+            outcome = self.fetch_coordinator.do(url, fetch, lambda: self.should_stop)
+            if outcome is None:
+                return None
+            text, aborted, leader_failure = outcome
+            if not aborted or self.should_stop:
+                if failure is not None:
+                    failure.update(leader_failure)
+                return text
+            # The job that fetched for us was cancelled; fetch again ourselves
+
+    def fetch_page_direct(self, url, retries=5, referer=None, failure=None):
+        if self.should_stop:
+            return None
+        failure = failure if failure is not None else {}
+
+        cached = self.cache.get(url) if self.cache else None
+        if cached and (self.offline or self.cache.is_fresh(cached)):
+            self.metrics.inc('fetch_requests_total', outcome='cache_hit')
+            return cached['text']
+        if self.offline:
+            self.log(f"Offline mode: {url} is not in the cache.")
+            failure.update(reason="not in cache (offline)", attempts=0)
+            return None
+
+        # Referer is sent per request; mutating the shared session headers is not safe
+        # once several workers use the session at the same time
+        headers = {'Referer': referer} if referer else {}
+        if cached:
+            # Stale copy: ask the server whether it changed
+            headers.update(self.cache.conditional_headers(cached))
         
+        reason = None
         for i in range(retries):
+            if i:
+                self.metrics.inc('fetch_retries_total')
+            if self.rate_limiter:
+                waited = time.monotonic()
+                if not self.rate_limiter.wait(url, lambda: self.should_stop):
+                    return None
+                self.metrics.observe('throttle_wait_seconds', time.monotonic() - waited)
+            started = time.monotonic()
             try:
-                response = self.session.get(url, timeout=15)
+                response = self.transport.get(url, headers=headers, timeout=15)
+                self.metrics.observe('fetch_seconds', time.monotonic() - started)
+                self.metrics.inc('fetch_bytes_total', len(response.content))
+                if response.status_code in (429, 503):
+                    self.metrics.inc('fetch_requests_total', outcome='busy')
+                    # Explicit overload: slow the host down and honour Retry-After
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                    if self.rate_limiter:
+                        self.rate_limiter.on_busy(url, retry_after)
+                    wait_time = max(retry_after or 0, backoff_delay(i, base=2.0))
+                    reason = f"HTTP {response.status_code}"
+                    self.log(f"Server returned {response.status_code} at {url}. Retrying in {wait_time:.1f}s ({i+1}/{retries})...")
+                    if not self.pause(wait_time):
+                        return None
+                    continue
+                if response.status_code == 304 and cached:
+                    self.metrics.inc('fetch_requests_total', outcome='not_modified')
+                    self.cache.touch(url)
+                    if self.rate_limiter:
+                        self.rate_limiter.on_success(url, time.monotonic() - started)
+                    return cached['text']
                 response.raise_for_status()
-                response.encoding = 'utf-8' # Force UTF-8
-                text = response.text
+                text = response.text # Always decoded as UTF-8
                 
                 # Check for specific "Traffic too high" error
                 if "流量過大" in text or "System is busy" in text:
-                    wait_time = (i + 1) * 2 # Exponential backoff: 2, 4, 6...
-                    self.log(f"Server busy (流量過大) at {url}. Retrying in {wait_time}s ({i+1}/{retries})...")
-                    time.sleep(wait_time)
+                    self.metrics.inc('fetch_requests_total', outcome='busy')
+                    if self.rate_limiter:
+                        self.rate_limiter.on_busy(url)
+                    wait_time = backoff_delay(i, base=2.0)
+                    reason = "server busy (流量過大)"
+                    self.log(f"Server busy (流量過大) at {url}. Retrying in {wait_time:.1f}s ({i+1}/{retries})...")
+                    if not self.pause(wait_time):
+                        return None
                     continue
-                    
+
+                self.metrics.inc('fetch_requests_total', outcome='ok')
+                if self.rate_limiter:
+                    self.rate_limiter.on_success(url, time.monotonic() - started)
+                if self.cache:
+                    self.cache.store(url, text, response.headers.get('ETag'), response.headers.get('Last-Modified'))
                 return text
-            except requests.RequestException as e:
-                wait_time = (i + 1) * 2
-                self.log(f"Error fetching {url}: {e}. Retrying within {wait_time}s ({i+1}/{retries})...")
-                time.sleep(wait_time)
+            except TransportError as e:
+                self.metrics.inc('fetch_requests_total', outcome='error')
+                reason = str(e)
+                if e.status_code is not None and e.status_code < 500:
+                    # Dead link or rejected request: asking again won't help, and it says nothing about load
+                    self.log(f"Error fetching {url}: {e}. Not retrying.")
+                    failure.update(reason=reason, attempts=i + 1)
+                    return None
+                if self.rate_limiter and e.status_code is None:
+                    # Timeouts and connection errors mean congestion; other 5xx errors are retried at the same rate
+                    self.rate_limiter.on_busy(url)
+                wait_time = backoff_delay(i, base=2.0)
+                self.log(f"Error fetching {url}: {e}. Retrying within {wait_time:.1f}s ({i+1}/{retries})...")
+                if not self.pause(wait_time):
+                    return None
         
         self.log(f"Failed to fetch {url} after {retries} retries.")
+        failure.update(reason=reason, attempts=retries)
         return None
 
+    def record_failure(self, url, stage, reason, started, attempts=0, **context):
+        """Add a URL to the failure ledger; context says what it was (kind, uni_name, uni_url...)."""
+        entry = {
+            'url': url,
+            'stage': stage,
+            'reason': reason,
+            'attempts': attempts,
+            'seconds': round(time.monotonic() - started, 3),
+            'at': time.time(),
+        }
+        entry.update(context)
+        with self.progress_lock:
+            self.failures.append(entry)
+        self.metrics.inc('failures_total', stage=stage)
+
+    def pause(self, seconds):
+        """Sleep between retries, cut short by a stop request. Returns False if stopped."""
+        self.metrics.inc('backoff_seconds_total', seconds)
+        return sleep_until(time.monotonic() + seconds, lambda: self.should_stop)
+
     def get_universities(self):
         self.log("Fetching university list...")
         # Main page doesn't need specific referer, or use itself
-        html = self.fetch_page(self.base_url, referer=self.base_url)
+        started, failure = time.monotonic(), {}
+        html = self.fetch_page(self.base_url, referer=self.base_url, failure=failure)
         if not html:
+            if failure:
+                self.record_failure(self.base_url, 'fetch', failure['reason'], started, failure['attempts'], kind='index')
             return []
 
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Based on inspection: table tr td a -> href has 'ShowSchGsd.php?colno=XXX'
-        uni_links = soup.select('table tr td a[href^="ShowSchGsd.php"]')
-        
-        universities = []
-        for link in uni_links:
-            href = link.get('href')
-            name = link.text.strip()
-            # Extract code from href
-            match = re.search(r'colno=(\w+)', href)
-            code = match.group(1) if match else "Unknown"
-            
-            full_url = urljoin(self.base_url, href)
-            universities.append({
-                "name": name,
-                "code": code,
-                "url": full_url
-            })
-            
+        universities = parse_universities(html, self.base_url, self.parser_backend)
         self.universities = universities
         self.log(f"Found {len(universities)} universities.")
         return universities
 
-    def get_departments(self, uni_url):
+    def get_departments(self, uni_url, uni_name=None):
         # Use main page as referer for uni page
-        html = self.fetch_page(uni_url, referer=self.base_url)
+        started, failure = time.monotonic(), {}
+        html = self.fetch_page(uni_url, referer=self.base_url, failure=failure)
         if not html:
+            if failure:
+                self.record_failure(uni_url, 'fetch', failure['reason'], started, failure['attempts'],
+                                    kind='university', uni_name=uni_name)
             return []
 
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Based on inspection: department details are in table[border="1"]
-        # The link to details is usually in the last column or similar
-        # Pattern: ./html/115_XXXXX.htm
-        
-        dept_links = soup.select('a[href*="/html/"]')
-        
-        departments = []
-        for link in dept_links:
-            href = link.get('href')
-            # Check if it looks like a department detail link (usually contains numbers)
-            if "htm" in href:
-                full_url = urljoin(uni_url, href)
-                departments.append({
-                    "url": full_url
-                })
-                
+        started = time.perf_counter()
+        departments = parse_department_links(html, uni_url, self.parser_backend)
+        self.metrics.observe('parse_seconds', time.perf_counter() - started, stage='department_links')
         return departments
 
     def clean_text(self, text):
-        if not text:
-            return ""
-        return text.strip().replace('\xa0', '').replace('\r', '').replace('\n', '')
+        return clean_text(text)
 
     def get_department_details(self, dept_url, uni_name, uni_url):
-        # Use uni page as referer for dept page
-        html = self.fetch_page(dept_url, referer=uni_url)
+        html = self.fetch_department({'url': dept_url, 'uni_name': uni_name, 'uni_url': uni_url})
         if not html:
             return None
+        return self.parse_department_details(html, dept_url, uni_name, uni_url)
 
-        soup = BeautifulSoup(html, 'html.parser')
-        data = {}
-        
-        # School Name and Department Name
-        # Based on browser inspection: .colname (school) and .gsdname (dept)
-        # But let's look for robust selectors.
-        # Often these pages use tables for layout.
-        
-        # We can extract from text or specific classes if they exist.
-        # Try to find common labels in the table.
-        
-        try:
-            # 1. Basic Info
-            # Extract text containing labels
-            text_content = soup.get_text()
-            
-            # School Name
-            school_name_span = soup.select_one('.colname')
-            data['學校名稱'] = self.clean_text(school_name_span.text) if school_name_span else uni_name
-            
-            # Department Name
-            dept_name_span = soup.select_one('.gsdname')
-            dept_name_text = self.clean_text(dept_name_span.text) if dept_name_span else ""
-            
-            # Extract code from title (format: (12345)Name) or from table
-            data['校系代碼'] = ""
-            data['學系名稱'] = dept_name_text
-            
-            match = re.match(r'\((\d+)\)(.+)', dept_name_text)
-            if match:
-                data['校系代碼'] = match.group(1)
-                data['學系名稱'] = match.group(2).strip()
-            else:
-                # Fallback: look for "校系代碼" in table
-                code_label = soup.find(string=re.compile(r'校系代碼'))
-                if code_label:
-                    parent_td = code_label.find_parent('td')
-                    if parent_td:
-                        next_td = parent_td.find_next_sibling('td')
-                        if next_td:
-                            data['校系代碼'] = self.clean_text(next_td.text)
-
-            # 2. Extract Table Data
-            
-            def get_value_by_header(header_pattern, search_next_row=False):
-                # Find a td/th containing the header
-                element = soup.find(string=re.compile(header_pattern))
-                if element:
-                    parent_td = element.find_parent('td')
-                    if not parent_td: return ""
-                    
-                    if search_next_row:
-                        # Find the row of this element, then get next row's cell at same index or similar
-                        current_tr = parent_td.find_parent('tr')
-                        if current_tr:
-                            next_tr = current_tr.find_next_sibling('tr')
-                            if next_tr:
-                                # Often the structure implies the value is in a cell in the next row
-                                # Sometimes "可填志願數" is the label in next row, and value is next to IT.
-                                # Let's search for label in next row if specified, or just value.
-                                pass
-                    
-                    # Default: next sibling TD
-                    next_td = parent_td.find_next_sibling('td')
-                    if next_td:
-                        return self.clean_text(next_td.text)
-                return ""
-
-            data['學群類別'] = get_value_by_header(r'學群類別')
-            
-            # Quotas
-            # Store the elements to help find volunteer counts relative to them
-            quota_label = soup.find(string=re.compile(r'招生名額'))
-            if quota_label:
-                # Value is next td
-                q_td = quota_label.find_parent('td').find_next_sibling('td')
-                data['招生名額'] = self.clean_text(q_td.text) if q_td else ""
-                
-                # Check for "可填志願數" in the NEXT row
-                # Structure: <tr><td>招生名額</td><td>4</td></tr> <tr><td>可填志願數</td><td>2</td></tr>
-                q_tr = quota_label.find_parent('tr')
-                if q_tr:
-                    next_tr = q_tr.find_next_sibling('tr')
-                    if next_tr:
-                        vol_label = next_tr.find(string=re.compile(r'可填志願數'))
-                        if vol_label:
-                            v_td = vol_label.find_parent('td').find_next_sibling('td')
-                            data['招生名額各學群可選填志願數'] = self.clean_text(v_td.text) if v_td else ""
-            
-            extra_quota_label = soup.find(string=re.compile(r'外加名額'))
-            if extra_quota_label:
-                eq_td = extra_quota_label.find_parent('td').find_next_sibling('td')
-                data['外加名額'] = self.clean_text(eq_td.text) if eq_td else ""
-                
-                # Volunteer count for extra
-                eq_tr = extra_quota_label.find_parent('tr')
-                if eq_tr:
-                    next_tr = eq_tr.find_next_sibling('tr')
-                    if next_tr:
-                        vol_label = next_tr.find(string=re.compile(r'可填志願數'))
-                        if vol_label:
-                            v_td = vol_label.find_parent('td').find_next_sibling('td')
-                            data['外加名額各學群可選填志願數'] = self.clean_text(v_td.text) if v_td else ""
-            
-            # Fallback for volunteers if not found by strict structure (some pages use full labels)
-            if not data.get('招生名額各學群可選填志願數'):
-                data['招生名額各學群可選填志願數'] = get_value_by_header(r'招生名額.*志願數')
-            if not data.get('外加名額各學群可選填志願數'):
-                data['外加名額各學群可選填志願數'] = get_value_by_header(r'外加名額.*志願數')
-
-
-            # 3. Test Standards (檢定標準)
-            standards = {'國文': '', '英文': '', '數學A': '', '數學B': '', '社會': '', '自然': '', '英聽': ''}
-            
-            # Strategy: Find "國文" label. 
-            # Case A: Separate cells.
-            # Case B: Multi-line cell (br separated).
-            
-            # list of all subject keys
-            subj_keys = list(standards.keys())
-            
-            # Helper for strict matching
-            def strict_match(pattern):
-                return re.compile(f'^\\s*{pattern}\\s*$')
-
-            # Try to find a cell that contains MULTIPLE subjects (Case B)
-            # We look for "國文" and check if "英文" is also in the same cell
-            found_multi_mode = False
-            
-            # Use strict match to avoid matching "國語文..." in rank items
-            first_subj = soup.find(string=strict_match('國文'))
-            if first_subj:
-                parent_td = first_subj.find_parent('td')
-                # Check if "英文" text node exists in the same TD
-                if parent_td and parent_td.find(string=strict_match('英文')):
-                    found_multi_mode = True
-                    # This is the condensed table mode (Kang Ning style)
-                    
-                    # Extract subjects from parent_td
-                    subjects_in_order = [s.strip() for s in parent_td.stripped_strings if s.strip() in subj_keys]
-                    
-                    # Get value TD
-                    val_td = parent_td.find_next_sibling('td')
-                    if val_td:
-                        values_in_order = [v.strip() for v in val_td.stripped_strings]
-                        
-                        for i, subj in enumerate(subjects_in_order):
-                            if i < len(values_in_order):
-                                standards[subj] = values_in_order[i]
-            
-            if not found_multi_mode:
-                # Case A: Standard table (one subject per cell header)
-                for subject in standards.keys():
-                    # Exact match prevents matching "國文" in "國文檢定標準" or "國語文"
-                    subj_cell = soup.find(string=strict_match(subject))
-                    if subj_cell:
-                         parent = subj_cell.find_parent('td')
-                         if parent:
-                             next_td = parent.find_next_sibling('td')
-                             if next_td:
-                                 standards[subject] = self.clean_text(next_td.text)
-
-            # 4. Ranking Items (分發比序項目)
-            rank_items = {}
-            for i in range(1, 9):
-                rank_items[f'分發比序項目{i}'] = ""
-
-            # Try to find the block containing 1. or 1、
-            # It might be a big cell with all items
-            
-            # Look for "1." or "1、"
-            start_marker = soup.find(string=re.compile(r'1[\.、]'))
-            if start_marker:
-                container_td = start_marker.find_parent('td')
-                if container_td:
-                    # Get all text lines
-                    lines = [ln.strip() for ln in container_td.stripped_strings if ln.strip()]
-                    
-                    # Parse lines
-                    current_idx = 0
-                    for line in lines:
-                        # Check if line starts with specific number
-                        # Match 1. or 1、 or 2. ...
-                        m = re.match(r'^(\d+)[\.、](.+)', line)
-                        if m:
-                            idx = int(m.group(1))
-                            content = m.group(2).strip()
-                            if 1 <= idx <= 8:
-                                rank_items[f'分發比序項目{idx}'] = content
-                                current_idx = idx
-                        elif current_idx > 0:
-                            # Continuation of previous item?
-                            # Usually items are one per line or separated clearly.
-                            # If it doesn't start with number, maybe append? 
-                            # But simple extraction is usually enough.
-                            pass
-
-            data.update(standards)
-            data.update(rank_items)
-            
-            return data
+    def fetch_department(self, dept):
+        # Use uni page as referer for dept page
+        started, failure = time.monotonic(), {}
+        html = self.fetch_page(dept['url'], referer=dept['uni_url'], failure=failure)
+        if not html and failure:
+            self.record_failure(dept['url'], 'fetch', failure['reason'], started, failure['attempts'],
+                                kind='department', uni_name=dept['uni_name'], uni_url=dept['uni_url'])
+        return html
 
+    def parse_department_details(self, html, dept_url, uni_name, uni_url=None):
+        timings = {}
+        started = time.monotonic()
+        try:
+            return parse_department(html, uni_name, self.parser_backend, timings)
         except Exception as e:
             self.log(f"Error parsing {dept_url}: {e}")
+            self.record_failure(dept_url, 'parse', str(e), started,
+                                kind='department', uni_name=uni_name, uni_url=uni_url)
             return None
+        finally:
+            self.record_parse_timings(timings)
 
-    def run(self, target_universities=None):
+    def record_parse_timings(self, timings):
+        for stage, seconds in timings.items():
+            self.metrics.observe('parse_seconds', seconds, stage=stage)
+
+    def run(self, target_universities=None, resume=False, retry_universities=None):
         """
+        Universities are scanned while department details are fetched: each university's
+        departments are queued for the detail workers as soon as its page is parsed.
+
         :param target_universities: List of university names to scrape. If None, scrape all.
+        :param resume: Continue from self.checkpoint: reuse the saved department list,
+                       re-emit finished rows, only fetch the remaining departments
+                       (which after a finished run are exactly the failed ones) and
+                       scan the universities discovery had not reached.
+        :param retry_universities: With resume, universities ({'name', 'url'}) whose department
+                                   list failed to load; they are scanned again and their
+                                   departments added to the end of the saved list.
         """
+        self.failures = []
+        departments, completed, universities = None, {}, []
+        if resume and self.checkpoint:
+            departments, completed, unscanned = self.checkpoint.load()
+            if departments is not None:
+                self.log(f"Resuming: {len(completed)}/{len(departments)} departments already done, "
+                         f"{len(unscanned)} universities left to scan.")
+                unscanned_urls = {uni['url'] for uni in unscanned}
+                universities = unscanned + [uni for uni in retry_universities or [] if uni['url'] not in unscanned_urls]
+
+        if departments is None:
+            universities = self.select_universities(target_universities)
+            if universities is None:
+                return
+            departments = []
+        known_urls = {dept['url'] for dept in departments}
+
+        def scan(uni):
+            depts = [dept for dept in self.get_departments(uni['url'], uni['name']) if dept['url'] not in known_urls]
+            for dept in depts:
+                dept['uni_name'] = uni['name'] # Pass uni name
+                dept['uni_url'] = uni['url']   # Pass uni url for referer
+            if self.max_workers == 1 and not self.rate_limiter and not self.offline:
+                # Add random delay between universities
+                time.sleep(random.uniform(1.0, 3.0))
+            return depts
+
+        # Group 0 is the saved department list, group g the departments of universities[g - 1]
+        order = DepartmentOrder(1 + len(universities))
+        order.add(0, departments)
+        if universities:
+            self.log(f"Scanning {len(universities)} universities while fetching department details...")
+
+        scanned = [0]
+        fetched = [len(completed)]
+        self.scan_progress = (0, len(universities))
+
+        def report(label):
+            if not self.progress_callback:
+                return
+            message = f"{label} ({fetched[0]}/{order.found})"
+            if scanned[0] < len(universities):
+                message += f"，已掃描學校 {scanned[0]}/{len(universities)}"
+            self.progress_callback(fetched[0], order.found, message, phase="details")
+
+        # Rows finished out of order wait here until every earlier department is done,
+        # so output keeps department order while holding only the gap in memory
+        waiting = {}
+        next_index = [0]
+
+        def release(i, row):
+            waiting[i] = row
+            while next_index[0] in waiting:
+                ready = waiting.pop(next_index[0])
+                next_index[0] += 1
+                if ready:
+                    self.emit_row(ready)
+
+        for i, row in sorted(completed.items()):
+            release(i, row)
+
+        # Checkpointed rows are indexed into the saved department list. It is saved again
+        # whenever the placed groups grow (after every university when scanning in order),
+        # together with the universities after them; rows beyond it wait in unsaved.
+        saved_groups, saved = [order.placed], [len(departments)]
+        unsaved = []
+
+        def save_placed():
+            placed_departments = order.departments(placed_only=True)
+            # Group g > 0 is universities[g - 1], so the unplaced ones start at universities[placed - 1]
+            self.checkpoint.save_departments(placed_departments, universities[order.placed - 1:])
+            saved_groups[0], saved[0] = order.placed, len(placed_departments)
+            waiting_rows = []
+            for index, url, row in unsaved:
+                if index < saved[0]:
+                    self.checkpoint.record(index, url, row)
+                else:
+                    waiting_rows.append((index, url, row))
+            unsaved[:] = waiting_rows
+
+        def finish(index, dept, row):
+            if row and self.checkpoint:
+                if index < saved[0]:
+                    self.checkpoint.record(index, dept['url'], row)
+                else:
+                    unsaved.append((index, dept['url'], row))
+            release(index, row)
+
+        def on_scanned(group, uni, depts):
+            scanned[0] += 1
+            self.scan_progress = (scanned[0], len(universities))
+            for index, dept, row in order.add(group, depts):
+                finish(index, dept, row)
+            if self.checkpoint and order.placed > saved_groups[0]:
+                save_placed()
+            if scanned[0] == len(universities):
+                self.log(f"Found {order.found} departments.")
+            report(f"正在掃描學校: {uni['name']}")
+
+        if self.checkpoint and universities:
+            save_placed()
+
+        self.change_stats = {'new': 0, 'changed': 0, 'unchanged': 0, 'removed': 0}
+
+        def fetch_details(dept):
+            html = self.fetch_department(dept)
+            if not html:
+                return None
+            return self.extract_row(dept, html)
+
+        def on_details(key, dept, result):
+            row = None
+            if result:
+                row, change = result
+                self.change_stats[change] += 1
+                self.metrics.inc('departments_total', change=change)
+            else:
+                self.metrics.inc('departments_total', change='failed')
+            for index, placed_dept, placed_row in order.place(*key, row):
+                finish(index, placed_dept, placed_row)
+            fetched[0] += 1
+            report(f"正在抓取系所詳細資料: {dept['uni_name']}")
+
+        todo = [((0, i), dept) for i, dept in enumerate(departments) if i not in completed]
+        try:
+            if self.parse_workers:
+                self.run_parse_pipeline(todo, universities, scan, on_scanned, on_details)
+            else:
+                self.run_crawl(todo, universities, scan, fetch_details, on_scanned, on_details)
+        finally:
+            if self.checkpoint:
+                self.checkpoint.flush()
+        # Stopped early: flush what was finished, still in department order
+        for i in sorted(waiting):
+            if waiting[i]:
+                self.emit_row(waiting[i])
+        waiting.clear()
+        for row in order.held_rows():
+            if row:
+                self.emit_row(row)
+
+        if self.department_store and not self.should_stop:
+            # Universities that returned departments; only those can have removed ones
+            all_departments = order.departments()
+            scanned_uni_urls = list(dict.fromkeys(dept['uni_url'] for dept in all_departments))
+            self.change_stats['removed'] = self.department_store.remove_missing(
+                scanned_uni_urls, [dept['url'] for dept in all_departments]
+            )
+        if self.department_store:
+            self.log("Departments: {new} new, {changed} changed, {unchanged} unchanged, {removed} removed.".format(**self.change_stats))
+                
+        if self.progress_callback:
+             self.progress_callback(order.found, order.found, "完成！正在儲存檔案...", phase="done")
+
+    def run_sharded(self, work_queue, crawl_id, target_universities=None, resume=False, poll_interval=1.0):
+        """
+        Coordinator of a sharded crawl: queue the universities in work_queue (a WorkQueue shared
+        with ShardWorkers on other machines), report progress while the workers scan and fetch,
+        then emit the rows of every shard in department order.
+
+        :param resume: Continue the existing crawl_id, queueing its failed items again.
+        """
+        self.failures = []
+        if resume and work_queue.has_crawl(crawl_id):
+            work_queue.reopen(crawl_id)
+        else:
+            universities = self.select_universities(target_universities)
+            if universities is None:
+                return
+            work_queue.create_crawl(crawl_id, self.base_url, universities)
+            self.log(f"Queued {len(universities)} universities for the shard workers.")
+
+        while not self.should_stop and not work_queue.is_finished(crawl_id):
+            progress = work_queue.progress(crawl_id)
+            unis, depts = progress['universities'], progress['departments']
+            scanned = unis.get('done', 0) + unis.get('failed', 0)
+            fetched = depts.get('done', 0) + depts.get('failed', 0)
+            found = sum(depts.values())
+            self.scan_progress = (scanned, sum(unis.values()))
+            if self.progress_callback:
+                self.progress_callback(fetched, found, f"分散式抓取中 ({fetched}/{found})，已掃描學校 {scanned}/{sum(unis.values())}",
+                                       phase="details")
+            sleep_until(time.monotonic() + poll_interval, lambda: self.should_stop)
+
+        if self.should_stop:
+            # Workers stop taking its items; resume reopens it
+            work_queue.cancel(crawl_id)
+            return
+
+        rows = work_queue.rows(crawl_id)
+        for row in rows:
+            self.emit_row(row)
+        self.failures = work_queue.failures(crawl_id)
+        self.log(f"Merged {len(rows)} rows from the shard workers, {len(self.failures)} failed.")
+        if not self.failures:
+            work_queue.discard(crawl_id)
+        if self.progress_callback:
+            self.progress_callback(len(rows), len(rows), "完成！正在儲存檔案...", phase="done")
+
+    def select_universities(self, target_universities=None):
+        """The universities to crawl (all, or the named ones), or None if there are no universities."""
         self.get_universities()
         if not self.universities:
             self.log("No universities found.")
-            return
+            return None
 
         # Filter universities if targets provided
         if target_universities and len(target_universities) > 0:
             target_set = set(target_universities)
             self.universities = [u for u in self.universities if u['name'] in target_set]
             self.log(f"Filtered to {len(self.universities)} universities.")
+        return self.universities
 
-        all_departments = []
-        
-        # First, collect all department links
-        total_unis = len(self.universities)
-        for i, uni in enumerate(self.universities):
-            if self.should_stop: break
-            
-            if self.progress_callback:
-                self.progress_callback(i, total_unis, f"正在掃描學校: {uni['name']} ({i+1}/{total_unis})")
-            
-            depts = self.get_departments(uni['url'])
-            for dept in depts:
-                dept['uni_name'] = uni['name'] # Pass uni name
-                dept['uni_url'] = uni['url']   # Pass uni url for referer
-                all_departments.append(dept)
-                
-            # Add random delay between universities
-            time.sleep(random.uniform(1.0, 3.0))
+    def extract_row(self, dept, html):
+        """
+        Turn a fetched department page into an output row.
+        Returns (row, change) where change is 'new', 'changed' or 'unchanged', or None on parse failure.
+        """
+        page_hash, stored_hash, stored_row = self.page_state(dept, html)
+        if page_hash is not None and stored_hash == page_hash:
+            return stored_row, 'unchanged'
+        details = self.parse_department_details(html, dept['url'], dept['uni_name'], dept['uni_url'])
+        return self.store_row(dept, details, page_hash, stored_hash)
 
-        # Now fetching details
-        total_depts = len(all_departments)
-        self.log(f"Found {total_depts} departments. Starting detailed extraction...")
-        
-        for i, dept in enumerate(all_departments):
-            if self.should_stop: break
-            
-            if self.progress_callback:
-                # Progress phase 2: details
-                self.progress_callback(i, total_depts, f"正在抓取系所詳細資料: {dept['uni_name']} ({i+1}/{total_depts})", phase="details")
-            
-            details = self.get_department_details(dept['url'], dept['uni_name'], dept['uni_url'])
-            if details:
-                # Order keys
-                ordered_data = {
-                    '學校名稱': details.get('學校名稱', ''),
-                    '學系名稱': details.get('學系名稱', ''),
-                    '校系代碼': details.get('校系代碼', ''),
-                    '學群類別': details.get('學群類別', ''),
-                    '招生名額': details.get('招生名額', ''),
-                    '外加名額': details.get('外加名額', ''),
-                    '招生名額各學群可選填志願數': details.get('招生名額各學群可選填志願數', ''),
-                    '外加名額各學群可選填志願數': details.get('外加名額各學群可選填志願數', ''),
-                    '國文檢定標準': details.get('國文', ''),
-                    '英文檢定標準': details.get('英文', ''),
-                    '數學A檢定標準': details.get('數學A', ''),
-                    '數學B檢定標準': details.get('數學B', ''),
-                    '社會檢定標準': details.get('社會', ''),
-                    '自然檢定標準': details.get('自然', ''),
-                    '英聽檢定標準': details.get('英聽', ''),
-                    '分發比序項目1': details.get('分發比序項目1', ''),
-                    '分發比序項目2': details.get('分發比序項目2', ''),
-                    '分發比序項目3': details.get('分發比序項目3', ''),
-                    '分發比序項目4': details.get('分發比序項目4', ''),
-                    '分發比序項目5': details.get('分發比序項目5', ''),
-                    '分發比序項目6': details.get('分發比序項目6', ''),
-                    '分發比序項目7': details.get('分發比序項目7', ''),
-                    '分發比序項目8': details.get('分發比序項目8', ''),
-                    '資料連結': dept['url']
-                }
-                self.results.append(ordered_data)
-                
-        if self.progress_callback:
-             self.progress_callback(total_depts, total_depts, "完成！正在儲存檔案...", phase="done")
+    def page_state(self, dept, html):
+        # (page_hash, stored_hash, stored_row); all None without a department store
+        if not self.department_store:
+            return None, None, None
+        page_hash = content_hash(PARSER_VERSION, dept['uni_name'], html)
+        stored_hash, stored_row = self.department_store.lookup(dept['url'])
+        return page_hash, stored_hash, stored_row
+
+    def store_row(self, dept, details, page_hash, stored_hash):
+        if not details:
+            return None
+        row = self.build_row(details, dept['url'])
+        if not self.department_store:
+            return row, 'new'
+        self.department_store.save(dept['url'], dept['uni_url'], page_hash, row)
+        return row, 'new' if stored_hash is None else 'changed'
+
+    def run_parse_pipeline(self, departments, universities, scan, on_scanned, on_details):
+        """
+        Fetch stage (threads, see run_crawl) -> bounded queue -> parse stage (process pool).
+        on_scanned and on_details are called from the calling thread, like run_crawl.
+        """
+        pages = queue.Queue(maxsize=self.parse_queue_size)
+        fetch_done = object()
+
+        def put(item):
+            # Block while the parse stage is behind, but never past a stop request
+            while not self.should_stop:
+                try:
+                    pages.put(item, timeout=0.2)
+                    return
+                except queue.Full:
+                    pass
+
+        fetch_error = []
+
+        def fetch_stage():
+            # A university's departments are only queued after its 'scanned' item
+            try:
+                self.run_crawl(departments, universities, scan, self.fetch_department,
+                               lambda group, uni, depts: put(('scanned', group, uni, depts)),
+                               lambda key, dept, html: put(('page', key, dept, html)))
+            except BaseException as e:
+                # Raised again in the calling thread once the fetcher has stopped
+                fetch_error.append(e)
+            finally:
+                put(fetch_done)
+
+        # spawn: fetch threads are already running and the Windows build has no fork anyway
+        pool = ProcessPoolExecutor(max_workers=self.parse_workers, mp_context=multiprocessing.get_context('spawn'))
+        fetcher = threading.Thread(target=fetch_stage, daemon=True)
+        pending = {}
+
+        def collect(futures):
+            for future in futures:
+                key, dept, page_hash, stored_hash = pending.pop(future)
+                details, error, timings = future.result()
+                self.record_parse_timings(timings)
+                if error:
+                    self.log(f"Error parsing {dept['url']}: {error}")
+                    # Parsed in another process: its measured parse time is the failure's duration
+                    self.record_failure(dept['url'], 'parse', error, time.monotonic() - sum(timings.values()),
+                                        kind='department', uni_name=dept['uni_name'], uni_url=dept['uni_url'])
+                on_details(key, dept, self.store_row(dept, details, page_hash, stored_hash))
+
+        try:
+            fetcher.start()
+            while not self.should_stop:
+                try:
+                    item = pages.get(timeout=0.2)
+                except queue.Empty:
+                    collect([f for f in list(pending) if f.done()])
+                    continue
+                if item is fetch_done:
+                    break
+
+                kind, key, dept, html = item
+                if kind == 'scanned':
+                    on_scanned(key, dept, html)
+                    continue
+                if not html:
+                    on_details(key, dept, None)
+                    continue
+                page_hash, stored_hash, stored_row = self.page_state(dept, html)
+                if page_hash is not None and stored_hash == page_hash:
+                    on_details(key, dept, (stored_row, 'unchanged'))
+                    continue
+
+                future = pool.submit(parse_department_job, html.encode('utf-8'), dept['uni_name'], self.parser_backend)
+                pending[future] = (key, dept, page_hash, stored_hash)
+                # Keep the number of pages held by the parse stage bounded as well
+                if len(pending) >= self.parse_queue_size:
+                    done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                    collect(done)
+                else:
+                    collect([f for f in list(pending) if f.done()])
+
+            while pending and not self.should_stop:
+                done, _ = wait(list(pending), timeout=0.2, return_when=FIRST_COMPLETED)
+                collect(done)
+        except BaseException:
+            # Unblock and stop the fetch stage before propagating
+            self.should_stop = True
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            fetcher.join()
+        if fetch_error:
+            raise fetch_error[0]
+
+    def run_crawl(self, departments, universities, scan, task, on_scanned, on_result):
+        """
+        Run task(dept) for the given departments and for the departments of every university,
+        serially or on one bounded thread pool that also scans the universities. scan(uni)
+        returns a university's departments; they are queued for task() right away, so detail
+        work starts with the first scanned university instead of after the last one.
+
+        departments: [(key, dept)] known up front. The departments of universities[g - 1]
+        get the keys (g, position). on_scanned(g, uni, depts) and on_result(key, dept, result)
+        are always called from the calling thread.
+        """
+        ready = collections.deque(departments)
+        unscanned = collections.deque(enumerate(universities, 1))
+
+        if self.max_workers == 1:
+            # Finish each university's departments before scanning the next one
+            while not self.should_stop and (ready or unscanned):
+                if ready:
+                    key, dept = ready.popleft()
+                    on_result(key, dept, task(dept))
+                else:
+                    group, uni = unscanned.popleft()
+                    depts = scan(uni)
+                    on_scanned(group, uni, depts)
+                    ready.extend(((group, j), dept) for j, dept in enumerate(depts))
+            return
+
+        # A few workers keep discovery going, the rest take department pages as they appear
+        scan_slots = max(1, self.max_workers // 4)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        scans, details = {}, {}
+        try:
+            while not self.should_stop:
+                while len(scans) + len(details) < self.max_workers:
+                    if unscanned and (len(scans) < scan_slots or not ready):
+                        group, uni = unscanned.popleft()
+                        scans[executor.submit(scan, uni)] = (group, uni)
+                    elif ready:
+                        key, dept = ready.popleft()
+                        details[executor.submit(task, dept)] = (key, dept)
+                    else:
+                        break
+                if not scans and not details:
+                    break
+
+                done, _ = wait(list(scans) + list(details), return_when=FIRST_COMPLETED)
+                for future in done:
+                    if self.should_stop: break
+                    if future in scans:
+                        group, uni = scans.pop(future)
+                        depts = future.result()
+                        on_scanned(group, uni, depts)
+                        ready.extend(((group, j), dept) for j, dept in enumerate(depts))
+                    else:
+                        key, dept = details.pop(future)
+                        on_result(key, dept, future.result())
+        finally:
+            # Only running tasks are submitted; in-flight fetches return early via should_stop
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def emit_row(self, row):
+        self.row_count += 1
+        self.metrics.inc('rows_total')
+        if self.sink:
+            self.sink.write(row)
+        if self.keep_results:
+            self.results.append(row)
+
+    def build_row(self, details, url):
+        # Order keys; the subject standards are stored under the bare subject name
+        row = {}
+        for column in COLUMNS:
+            key = column[:-len('檢定標準')] if column.endswith('檢定標準') else column
+            row[column] = details.get(key, '')
+        row['資料連結'] = url
+        return row
 
     def save_to_excel(self, filename):
         df = pd.DataFrame(self.results)
         df.to_excel(filename, index=False)
         self.log(f"Saved to {filename}")
         return filename
+
+    def save_to_parquet(self, filename):
+        # Typed columns (integer quotas, categorical standards, list of rank items)
+        from columnar import ParquetSink
+        with ParquetSink(filename) as sink:
+            for row in self.results:
+                sink.write(row)
+        self.log(f"Saved to {filename}")
+        return filename
+
+    def save_to_arrow(self, filename):
+        # Arrow IPC file, can be memory-mapped by readers
+        from columnar import ArrowSink
+        with ArrowSink(filename) as sink:
+            for row in self.results:
+                sink.write(row)
+        self.log(f"Saved to {filename}")
+        return filename
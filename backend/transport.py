@@ -0,0 +1,123 @@
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+    HAS_HTTPX = True
+except ImportError:
+    HAS_HTTPX = False
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HAS_H2 = True
+except ImportError:
+    HAS_H2 = False
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,image/apng,*/*;q=0.8",
+    "Accept-Language": "zh-TW,zh;q=0.9,en-US;q=0.8,en;q=0.7",
+    "Connection": "keep-alive",
+}
+
+
+class TransportError(Exception):
+    """Network failure or HTTP error status, whatever client raised it."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        # The HTTP status of an error response; None for timeouts and connection errors
+        self.status_code = status_code
+
+
+class FetchResponse:
+    """The parts of a response the scraper uses. Bodies are always decoded as UTF-8."""
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise TransportError(f"HTTP {self.status_code}", self.status_code)
+
+
+class RequestsTransport:
+    """
+    requests.Session with an explicit connection pool. Safe to share between
+    threads as long as callers pass per-request headers instead of editing
+    the session's. pool_block makes extra threads wait for a free connection
+    rather than opening throwaway ones.
+    """
+
+    name = 'requests'
+
+    def __init__(self, pool_size=10, pool_block=True):
+        self.session = requests.Session()
+        self.session.headers.update(DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=pool_block)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, headers=None, timeout=15):
+        try:
+            response = self.session.get(url, headers=headers, timeout=timeout)
+        except requests.RequestException as e:
+            raise TransportError(str(e)) from e
+        return FetchResponse(response.status_code, response.headers, response.content)
+
+    def close(self):
+        self.session.close()
+
+
+class HttpxTransport:
+    """httpx client; multiplexes requests to one host over a single HTTP/2 connection when http2 is on."""
+
+    name = 'httpx'
+
+    def __init__(self, pool_size=10, http2=True, keepalive_expiry=30.0):
+        self.http2 = http2 and HAS_H2
+        self.client = httpx.Client(
+            http2=self.http2,
+            headers=DEFAULT_HEADERS,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size,
+                                keepalive_expiry=keepalive_expiry),
+        )
+
+    def get(self, url, headers=None, timeout=15):
+        try:
+            response = self.client.get(url, headers=headers, timeout=timeout)
+        except httpx.HTTPError as e:
+            raise TransportError(str(e)) from e
+        return FetchResponse(response.status_code, response.headers, response.content)
+
+    def close(self):
+        self.client.close()
+
+
+_warned = set()
+_warn_lock = threading.Lock()
+
+
+def make_transport(kind='requests', pool_size=10, http2=False):
+    """
+    Build a transport: kind is 'requests' or 'httpx' (http2=True implies httpx).
+    Falls back to requests when httpx is not installed.
+    """
+    if (kind == 'httpx' or http2) and not HAS_HTTPX:
+        with _warn_lock:
+            if 'httpx' not in _warned:
+                _warned.add('httpx')
+                print("httpx is not installed, using requests (HTTP/1.1).")
+        kind, http2 = 'requests', False
+    if kind == 'httpx' or http2:
+        return HttpxTransport(pool_size, http2=http2)
+    return RequestsTransport(pool_size)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import threading
+import time
+
+
+class UniversityIndex:
+    """
+    In-process cache of university lists keyed by base URL.
+
+    Entries younger than ttl are served as is. Older ones (up to max_stale) are
+    still served immediately while a background thread refreshes them
+    (stale-while-revalidate); beyond that the list is loaded synchronously.
+    loader(base_url) must return the list of universities.
+    """
+
+    def __init__(self, loader, ttl=6 * 3600, max_stale=30 * 86400):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.refreshing = set()
+        self.key_locks = {}
+
+    def get(self, base_url):
+        """Return (universities, etag)."""
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(base_url)
+        if entry:
+            age = now - entry['fetched_at']
+            if age < self.ttl:
+                return entry['universities'], entry['etag']
+            if age < self.max_stale:
+                self.refresh_in_background(base_url)
+                return entry['universities'], entry['etag']
+        return self.load(base_url)
+
+    def load(self, base_url):
+        # One loader per URL at a time; the others wait and reuse its result
+        with self.lock:
+            key_lock = self.key_locks.setdefault(base_url, threading.Lock())
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(base_url)
+            if entry and time.time() - entry['fetched_at'] < self.ttl:
+                return entry['universities'], entry['etag']
+
+            universities = self.loader(base_url)
+            etag = self.make_etag(universities)
+            if universities:
+                # An empty list usually means the fetch failed; don't pin it
+                with self.lock:
+                    self.entries[base_url] = {
+                        'universities': universities,
+                        'etag': etag,
+                        'fetched_at': time.time(),
+                    }
+            return universities, etag
+
+    def refresh_in_background(self, base_url):
+        with self.lock:
+            if base_url in self.refreshing:
+                return
+            self.refreshing.add(base_url)
+
+        def refresh():
+            try:
+                universities = self.loader(base_url)
+                if universities:
+                    with self.lock:
+                        self.entries[base_url] = {
+                            'universities': universities,
+                            'etag': self.make_etag(universities),
+                            'fetched_at': time.time(),
+                        }
+            except Exception as e:
+                print(f"Background refresh of {base_url} failed: {e}")
+            finally:
+                with self.lock:
+                    self.refreshing.discard(base_url)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    @staticmethod
+    def make_etag(universities):
+        payload = json.dumps(universities, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        # Unquoted: werkzeug quotes it in the header and compares If-None-Match unquoted
+        return hashlib.sha256(payload).hexdigest()[:32]
@@ -0,0 +1,274 @@
+import json
+import sqlite3
+import threading
+import time
+
+# A university item is (group, -1); its departments are (group, 0..n-1). Rows merge in that order.
+UNIVERSITY_POSITION = -1
+
+
+class WorkQueue:
+    """
+    Shared sqlite queue of a sharded crawl's work items (universities, then their departments),
+    used by the coordinator and by ShardWorkers on any machine that can open the file. On a
+    network share (NFS, SMB) the share must support POSIX / byte-range locks.
+
+    Workers lease one item at a time for lease_seconds and renew the lease with heartbeats.
+    An item whose lease ran out (the worker died) is leased again by someone else. Failed
+    items are retried with backoff up to max_attempts leases, then stay 'failed'.
+    """
+
+    def __init__(self, path, max_attempts=3, retry_delay=30.0):
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.lock = threading.Lock()
+        # Several processes (and machines) write this file; wait for their locks instead of failing
+        self.db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        # Not WAL like the local stores: WAL needs shared memory on one host and breaks on a
+        # network filesystem. The rollback journal only needs the file locks to work there
+        self.db.execute("PRAGMA journal_mode=DELETE")
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS crawls (
+                crawl_id TEXT PRIMARY KEY,
+                base_url TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS work_items (
+                crawl_id TEXT NOT NULL,
+                grp INTEGER NOT NULL,
+                pos INTEGER NOT NULL,
+                url TEXT NOT NULL,
+                payload_json TEXT NOT NULL,
+                status TEXT NOT NULL,
+                lease_owner TEXT,
+                lease_expires REAL NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result_json TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (crawl_id, grp, pos)
+            );
+            CREATE INDEX IF NOT EXISTS work_items_status ON work_items (status, available_at);
+        """)
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def create_crawl(self, crawl_id, base_url, universities):
+        now = time.time()
+        with self.transaction() as db:
+            db.execute("INSERT INTO crawls VALUES (?, ?, 'running', ?)", (crawl_id, base_url, now))
+            db.executemany(
+                "INSERT INTO work_items (crawl_id, grp, pos, url, payload_json, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                [(crawl_id, group, UNIVERSITY_POSITION, uni['url'], json.dumps(uni, ensure_ascii=False), now)
+                 for group, uni in enumerate(universities)]
+            )
+
+    def has_crawl(self, crawl_id):
+        with self.lock:
+            return self.db.execute("SELECT 1 FROM crawls WHERE crawl_id = ?", (crawl_id,)).fetchone() is not None
+
+    def lease(self, worker_id, lease_seconds):
+        """
+        Lease the next item: departments before universities, earliest first. Returns
+        {crawl_id, base_url, group, position, url, payload, attempts} or None when idle.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            while True:
+                found = db.execute("""
+                    SELECT w.crawl_id, c.base_url, w.grp, w.pos, w.url, w.payload_json, w.attempts, w.status
+                    FROM work_items w JOIN crawls c ON c.crawl_id = w.crawl_id
+                    WHERE c.status = 'running' AND (
+                        (w.status = 'pending' AND w.available_at <= ?) OR (w.status = 'leased' AND w.lease_expires < ?))
+                    ORDER BY w.pos = -1, c.created_at, w.grp, w.pos
+                    LIMIT 1
+                """, (now, now)).fetchone()
+                if not found:
+                    return None
+                crawl_id, base_url, group, position, url, payload_json, attempts, status = found
+                if status == 'leased' and attempts >= self.max_attempts:
+                    # Its last worker died holding it; don't hand it out forever
+                    self.set_failed(db, crawl_id, group, position, {'stage': 'fetch', 'reason': 'worker lost'})
+                    continue
+                db.execute(
+                    "UPDATE work_items SET status = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                    "updated_at = ? WHERE crawl_id = ? AND grp = ? AND pos = ?",
+                    (worker_id, now + lease_seconds, now, crawl_id, group, position)
+                )
+                return {
+                    'crawl_id': crawl_id, 'base_url': base_url, 'group': group, 'position': position,
+                    'url': url, 'payload': json.loads(payload_json), 'attempts': attempts + 1,
+                }
+
+    def heartbeat(self, worker_id, items, lease_seconds):
+        """Extend the leases this worker still holds on items."""
+        expires = time.time() + lease_seconds
+        with self.transaction() as db:
+            db.executemany(
+                "UPDATE work_items SET lease_expires = ? "
+                "WHERE crawl_id = ? AND grp = ? AND pos = ? AND status = 'leased' AND lease_owner = ?",
+                [(expires, item['crawl_id'], item['group'], item['position'], worker_id) for item in items]
+            )
+
+    def complete_university(self, worker_id, item, departments):
+        """Queue a scanned university's departments and mark it done (ignored if the lease was lost)."""
+        now = time.time()
+        with self.transaction() as db:
+            if not self.owns(db, worker_id, item):
+                return False
+            db.executemany(
+                "INSERT OR IGNORE INTO work_items (crawl_id, grp, pos, url, payload_json, status, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, 'pending', ?)",
+                [(item['crawl_id'], item['group'], position, dept['url'], json.dumps(dept, ensure_ascii=False), now)
+                 for position, dept in enumerate(departments)]
+            )
+            self.set_done(db, item, {'departments': len(departments)})
+        return True
+
+    def complete_department(self, worker_id, item, row):
+        with self.transaction() as db:
+            if not self.owns(db, worker_id, item):
+                return False
+            self.set_done(db, item, {'row': row})
+        return True
+
+    def fail(self, worker_id, item, failure, retry=True):
+        """
+        Give an item back after a failure ({stage, reason, ...}). It is retried after
+        retry_delay * attempts unless retry is False or it ran out of attempts.
+        """
+        now = time.time()
+        with self.transaction() as db:
+            if not self.owns(db, worker_id, item):
+                return
+            if retry and item['attempts'] < self.max_attempts:
+                db.execute(
+                    "UPDATE work_items SET status = 'pending', lease_owner = NULL, available_at = ?, result_json = ?, "
+                    "updated_at = ? WHERE crawl_id = ? AND grp = ? AND pos = ?",
+                    (now + self.retry_delay * item['attempts'], json.dumps(failure, ensure_ascii=False), now,
+                     item['crawl_id'], item['group'], item['position'])
+                )
+            else:
+                self.set_failed(db, item['crawl_id'], item['group'], item['position'], failure)
+
+    def release(self, worker_id, item):
+        """Hand an unfinished item back without counting the attempt (the worker is stopping)."""
+        with self.transaction() as db:
+            db.execute(
+                "UPDATE work_items SET status = 'pending', lease_owner = NULL, attempts = attempts - 1, updated_at = ? "
+                "WHERE crawl_id = ? AND grp = ? AND pos = ? AND status = 'leased' AND lease_owner = ?",
+                (time.time(), item['crawl_id'], item['group'], item['position'], worker_id)
+            )
+
+    def owns(self, db, worker_id, item):
+        found = db.execute(
+            "SELECT 1 FROM work_items WHERE crawl_id = ? AND grp = ? AND pos = ? AND status = 'leased' AND lease_owner = ?",
+            (item['crawl_id'], item['group'], item['position'], worker_id)
+        ).fetchone()
+        return found is not None
+
+    def set_done(self, db, item, result):
+        db.execute(
+            "UPDATE work_items SET status = 'done', lease_owner = NULL, result_json = ?, updated_at = ? "
+            "WHERE crawl_id = ? AND grp = ? AND pos = ?",
+            (json.dumps(result, ensure_ascii=False), time.time(), item['crawl_id'], item['group'], item['position'])
+        )
+
+    def set_failed(self, db, crawl_id, group, position, failure):
+        db.execute(
+            "UPDATE work_items SET status = 'failed', lease_owner = NULL, result_json = ?, updated_at = ? "
+            "WHERE crawl_id = ? AND grp = ? AND pos = ?",
+            (json.dumps(failure, ensure_ascii=False), time.time(), crawl_id, group, position)
+        )
+
+    def progress(self, crawl_id):
+        """{'universities' | 'departments': {status: count}} of a crawl."""
+        with self.lock:
+            counts = self.db.execute(
+                "SELECT pos = ?, status, COUNT(*) FROM work_items WHERE crawl_id = ? GROUP BY pos = ?, status",
+                (UNIVERSITY_POSITION, crawl_id, UNIVERSITY_POSITION)
+            ).fetchall()
+        progress = {'universities': {}, 'departments': {}}
+        for is_university, status, count in counts:
+            progress['universities' if is_university else 'departments'][status] = count
+        return progress
+
+    def is_finished(self, crawl_id):
+        with self.lock:
+            found = self.db.execute(
+                "SELECT 1 FROM work_items WHERE crawl_id = ? AND status IN ('pending', 'leased') LIMIT 1", (crawl_id,)
+            ).fetchone()
+        return found is None
+
+    def rows(self, crawl_id):
+        """Finished rows of every shard merged in department order."""
+        with self.lock:
+            found = self.db.execute(
+                "SELECT result_json FROM work_items WHERE crawl_id = ? AND pos >= 0 AND status = 'done' ORDER BY grp, pos",
+                (crawl_id,)
+            ).fetchall()
+        return [json.loads(result_json)['row'] for (result_json,) in found]
+
+    def failures(self, crawl_id):
+        """Failure ledger entries (see StarPlanScraper.record_failure) of the items given up on."""
+        with self.lock:
+            found = self.db.execute(
+                "SELECT pos, payload_json, attempts, result_json, updated_at FROM work_items "
+                "WHERE crawl_id = ? AND status = 'failed' ORDER BY grp, pos", (crawl_id,)
+            ).fetchall()
+        failures = []
+        for position, payload_json, attempts, result_json, updated_at in found:
+            payload = json.loads(payload_json)
+            entry = {'url': payload['url'], 'attempts': attempts, 'at': updated_at}
+            if position == UNIVERSITY_POSITION:
+                entry.update(kind='university', uni_name=payload['name'])
+            else:
+                entry.update(kind='department', uni_name=payload.get('uni_name'), uni_url=payload.get('uni_url'))
+            entry.update(json.loads(result_json or '{}'))
+            failures.append(entry)
+        return failures
+
+    def reopen(self, crawl_id):
+        """Queue a crawl's failed items again with fresh attempts (resume / retry)."""
+        with self.transaction() as db:
+            db.execute("UPDATE crawls SET status = 'running' WHERE crawl_id = ?", (crawl_id,))
+            db.execute(
+                "UPDATE work_items SET status = 'pending', attempts = 0, available_at = 0, updated_at = ? "
+                "WHERE crawl_id = ? AND status = 'failed'", (time.time(), crawl_id)
+            )
+
+    def cancel(self, crawl_id):
+        """Stop handing out the crawl's items; leases already held finish or expire."""
+        with self.transaction() as db:
+            db.execute("UPDATE crawls SET status = 'cancelled' WHERE crawl_id = ?", (crawl_id,))
+
+    def discard(self, crawl_id):
+        with self.transaction() as db:
+            db.execute("DELETE FROM work_items WHERE crawl_id = ?", (crawl_id,))
+            db.execute("DELETE FROM crawls WHERE crawl_id = ?", (crawl_id,))
+
+
+class _Transaction:
+    """`with queue.transaction() as db:` runs the block in one IMMEDIATE (write-locked) transaction."""
+
+    def __init__(self, queue):
+        self.queue = queue
+
+    def __enter__(self):
+        self.queue.lock.acquire()
+        try:
+            # IMMEDIATE takes the write lock up front so workers on other machines cannot interleave
+            self.queue.db.execute("BEGIN IMMEDIATE")
+        except BaseException:
+            self.queue.lock.release()
+            raise
+        return self.queue.db
+
+    def __exit__(self, exc_type, *exc):
+        try:
+            self.queue.db.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.queue.lock.release()
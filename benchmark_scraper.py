@@ -0,0 +1,202 @@
+import argparse
+import http.server
+import json
+import multiprocessing
+import os
+import re
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Add backend to path
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(os.path.join(ROOT, 'backend'))
+
+from page_parser import available_backends, parse_department, resolve_backend
+from sinks import RowSink
+from star_scraper import StarPlanScraper
+
+# Offline throughput benchmark: serves the saved debug_*.html pages (or a synthetic
+# site of N universities x M departments) from a local HTTP server, runs
+# StarPlanScraper.run() against it and reports pages/s, parse time per page,
+# peak RSS and time to first row. No network access needed.
+#
+#   python benchmark_scraper.py                      # the real 64-university fixture list
+#   python benchmark_scraper.py -n 20 -m 50 -w 8     # synthetic 20 x 50 site, 8 fetch workers
+#   python benchmark_scraper.py --latency 30 --json  # 30 ms per response, machine-readable output
+
+
+def read_fixture(name):
+    with open(os.path.join(ROOT, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FixtureSite:
+    """
+    The pages a crawl sees. Department pages are rendered from debug_dept.html with
+    the code taken from the URL, so every row is distinct.
+    With universities=0 the saved main and university pages are served unchanged.
+    """
+
+    def __init__(self, universities=0, departments=0):
+        self.dept_template = read_fixture('debug_dept.html')
+        if universities:
+            links = ''.join(
+                f"<tr><td><a href=ShowSchGsd.php?colno={u:03d}>({u:03d})合成大學{u:03d}-{departments}校系</a></td></tr>"
+                for u in range(1, universities + 1)
+            )
+            self.main = f"<html><body><table>{links}</table></body></html>"
+            self.departments = departments
+            self.uni = None
+        else:
+            self.main = read_fixture('debug_main.html')
+            self.uni = read_fixture('debug_uni.html')
+
+    def page(self, path):
+        if 'ShowSchGsd' in path:
+            colno = re.search(r'colno=(\w+)', path).group(1)
+            if self.uni is not None:
+                return self.uni
+            links = ''.join(
+                f"<a href='./html/115_{colno}{d:02d}.htm?v=1.0' target='_blank' >詳細資料</a>"
+                for d in range(1, self.departments + 1)
+            )
+            return f"<html><body>{links}</body></html>"
+        match = re.search(r'/html/115_(\w+)\.htm', path)
+        if match:
+            code = match.group(1)
+            return (self.dept_template
+                    .replace('00101', code)
+                    .replace('國立臺灣大學', f'合成大學{code[:3]}')
+                    .replace('中國文學系', f'學系{code}'))
+        return self.main
+
+
+def start_server(site, latency=0.0):
+    counter = {'pages': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real site
+        # Headers and body go out in separate sends; with Nagle on, delayed ACKs add ~40 ms per page
+        disable_nagle_algorithm = True
+
+        def do_GET(self):
+            body = site.page(self.path).encode('utf-8')
+            if latency:
+                time.sleep(latency)
+            with lock:
+                counter['pages'] += 1
+                counter['bytes'] += len(body)
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, counter, f"http://127.0.0.1:{server.server_address[1]}/TotalGsdShow.htm"
+
+
+class FirstRowSink(RowSink):
+    def __init__(self):
+        self.first_row_at = None
+        self.rows = 0
+
+    def write(self, row):
+        if self.first_row_at is None:
+            self.first_row_at = time.perf_counter()
+        self.rows += 1
+
+
+def parse_micros(backend, iterations=200):
+    """Median microseconds to parse one department page with this backend."""
+    html = read_fixture('debug_dept.html')
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        parse_department(html, '國立臺灣大學', backend)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1e6
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    self_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children_kb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024  # bytes on macOS, KiB on Linux
+    return round(self_kb / scale, 1), round(children_kb / scale, 1)
+
+
+def run_benchmark(args):
+    site = FixtureSite(args.universities, args.departments)
+    server, counter, url = start_server(site, args.latency / 1000.0)
+    backend = resolve_backend(args.backend)
+    sink = FirstRowSink()
+    scraper = StarPlanScraper(
+        url, max_workers=args.workers, parser_backend=backend, parse_workers=args.parse_workers,
+        adaptive_rate=False, sink=sink, keep_results=False,
+    )
+    scraper.log = lambda message: None  # keep the report readable
+
+    started = time.perf_counter()
+    scraper.run()
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+
+    rss = peak_rss_mb()
+    return {
+        'site': f"{args.universities}x{args.departments}" if args.universities else 'fixtures',
+        'backend': backend,
+        'workers': args.workers,
+        'parse_workers': args.parse_workers,
+        'latency_ms': args.latency,
+        'rows': sink.rows,
+        'pages': counter['pages'],
+        'megabytes': round(counter['bytes'] / 1e6, 2),
+        'seconds': round(elapsed, 3),
+        'pages_per_second': round(counter['pages'] / elapsed, 1) if elapsed else None,
+        'parse_us_per_page': round(parse_micros(backend), 1),
+        'time_to_first_row_ms': round((sink.first_row_at - started) * 1000, 1) if sink.first_row_at else None,
+        'peak_rss_mb': rss[0] if rss else None,
+        'peak_rss_children_mb': rss[1] if rss else None,
+        # Where the crawl spent its time (network / throttle / parse)
+        'stages': scraper.metrics.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline scraper benchmark against a local stand-in server.")
+    parser.add_argument('-n', '--universities', type=int, default=0,
+                        help="synthetic universities (0 = serve the saved fixture pages)")
+    parser.add_argument('-m', '--departments', type=int, default=20, help="departments per synthetic university")
+    parser.add_argument('-w', '--workers', type=int, default=4, help="concurrent fetch workers")
+    parser.add_argument('-p', '--parse-workers', type=int, default=0, help="parse processes (0 = inline)")
+    parser.add_argument('-b', '--backend', default='auto', choices=['auto'] + available_backends())
+    parser.add_argument('--latency', type=float, default=0.0, help="added server latency per response, in ms")
+    parser.add_argument('--json', action='store_true', help="print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False))
+    else:
+        for key, value in report.items():
+            print(f"{key:>22}: {value}")
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    main()
@@ -13,6 +13,7 @@ const downloadBtn = document.getElementById('downloadBtn');
 
 let currentJobId = null;
 let pollInterval = null;
+let eventSource = null;
 let universities = [];
 
 fetchBtn.addEventListener('click', async () => {
@@ -26,11 +27,8 @@ fetchBtn.addEventListener('click', async () => {
     fetchBtn.textContent = '取得列表中...';
 
     try {
-        const response = await fetch('/api/fetch_universities', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ url })
-        });
+        // GET so the browser can revalidate its copy with the server's ETag
+        const response = await fetch(`/api/universities?url=${encodeURIComponent(url)}`);
 
         if (!response.ok) throw new Error('無法取得學校列表');
 
@@ -122,8 +120,8 @@ startBtn.addEventListener('click', async () => {
         const data = await response.json();
         currentJobId = data.job_id;
 
-        // Start polling
-        pollInterval = setInterval(checkStatus, 1000);
+        // Receive progress pushed by the server; fall back to polling without SSE
+        watchStatus();
 
     } catch (error) {
         console.error(error);
@@ -133,6 +131,38 @@ startBtn.addEventListener('click', async () => {
     }
 });
 
+function watchStatus() {
+    if (!window.EventSource) {
+        startPolling();
+        return;
+    }
+
+    eventSource = new EventSource(`/api/stream/${currentJobId}`);
+    eventSource.onmessage = (event) => applyStatus(JSON.parse(event.data));
+    eventSource.onerror = () => {
+        // Stream dropped (proxy, worker restart...): keep going with polling
+        stopWatching();
+        startPolling();
+    };
+}
+
+function startPolling() {
+    if (!pollInterval) {
+        pollInterval = setInterval(checkStatus, 1000);
+    }
+}
+
+function stopWatching() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    if (pollInterval) {
+        clearInterval(pollInterval);
+        pollInterval = null;
+    }
+}
+
 async function checkStatus() {
     if (!currentJobId) return;
 
@@ -140,26 +170,28 @@ async function checkStatus() {
         const response = await fetch(`/api/status/${currentJobId}`);
         if (!response.ok) return;
 
-        const data = await response.json();
-
-        // Update UI
-        progressBar.style.width = `${data.progress}%`;
-        statusText.textContent = `${data.message} (${data.progress}%)`;
-
-        if (data.status === 'completed') {
-            clearInterval(pollInterval);
-            finishJob(data.filename);
-        } else if (data.status === 'error') {
-            clearInterval(pollInterval);
-            alert(data.message);
-            resetUI();
-        }
+        applyStatus(await response.json());
 
     } catch (error) {
         console.error('Polling error:', error);
     }
 }
 
+function applyStatus(data) {
+    // Update UI
+    progressBar.style.width = `${data.progress}%`;
+    statusText.textContent = `${data.message} (${data.progress}%)`;
+
+    if (data.status === 'completed') {
+        stopWatching();
+        finishJob(data.filename);
+    } else if (data.status === 'error' || data.status === 'cancelled') {
+        stopWatching();
+        alert(data.message);
+        resetUI();
+    }
+}
+
 function finishJob(filename) {
     statusSection.classList.add('hidden');
     resultSection.classList.remove('hidden');
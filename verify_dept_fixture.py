@@ -0,0 +1,54 @@
+import sys
+import os
+
+# Add backend to path
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from page_parser import available_backends, parse_department
+
+# Regression check for the department page parser against the saved debug_dept.html
+# (NTU 中國文學系, fetched by diagnose_extraction.py). Runs offline.
+EXPECTED = {
+    '學校名稱': '國立臺灣大學',
+    '學系名稱': '中國文學系',
+    '校系代碼': '00101',
+    '學群類別': '第一類學群',
+    '招生名額': '6',
+    '外加名額': '無',
+    '招生名額各學群可選填志願數': '12',
+    '外加名額各學群可選填志願數': '--',
+    '國文': '頂標',
+    '英文': '前標',
+    '數學A': '均標',
+    '數學B': '均標',
+    '社會': '前標',
+    '自然': '--',
+    '英聽': '--',
+    '分發比序項目1': '在校學業成績全校排名百分比',
+    '分發比序項目2': '學測國文級分',
+    '分發比序項目3': '學測英文級分',
+    '分發比序項目4': '國語文學業成績總平均全校排名百分比',
+    '分發比序項目5': '英語文學業成績總平均全校排名百分比',
+    '分發比序項目6': '學測社會級分',
+    '分發比序項目7': '歷史學業成績總平均全校排名百分比',
+    '分發比序項目8': '',
+}
+
+fixture = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'debug_dept.html')
+with open(fixture, encoding='utf-8') as f:
+    html = f.read()
+
+# Every installed parser backend must extract identical rows
+failed = False
+for backend in available_backends():
+    data = parse_department(html, '國立臺灣大學', backend)
+    mismatches = [(key, expected, data.get(key)) for key, expected in EXPECTED.items() if data.get(key) != expected]
+    for key, expected, actual in mismatches:
+        print(f"[{backend}] MISMATCH {key}: expected {expected!r}, got {actual!r}")
+    if mismatches:
+        failed = True
+    else:
+        print(f"[{backend}] OK: all {len(EXPECTED)} fields match debug_dept.html")
+
+if failed:
+    sys.exit(1)